@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from fastapi import Header, HTTPException
+from models.user import User
+from utils import decode_access_token
+
+# Verified admin tokens kept in memory
+ADMIN_CACHE_SIZE = 1024
+# Upper bound on how long a principal is trusted without re-checking the DB
+ADMIN_CACHE_TTL = 300
+
+
+class AdminPrincipalCache:
+    """
+    Bounded LRU of verified admin token -> principal
+    Entries expire at the token's exp (or after ADMIN_CACHE_TTL, whichever is
+    first). revoke() bumps a version counter, which invalidates every entry
+    at once, e.g. after a user is deleted or loses the admin role.
+    """
+
+    def __init__(self, max_size: int = ADMIN_CACHE_SIZE, ttl: int = ADMIN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = 0
+        self._entries: "OrderedDict[str, Tuple[float, int, dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        expires_at, version, principal = entry
+        if version != self.version or expires_at <= time.time():
+            del self._entries[token]
+            return None
+        self._entries.move_to_end(token)
+        return principal
+
+    def set(self, token: str, principal: dict, token_exp: Optional[float]):
+        expires_at = time.time() + self.ttl
+        if token_exp:
+            expires_at = min(expires_at, token_exp)
+        self._entries[token] = (expires_at, self.version, principal)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def revoke(self):
+        self.version += 1
+        self._entries.clear()
+
+
+admin_cache = AdminPrincipalCache()
+
+
+async def admin_required(authorization: str = Header(..., description="Bearer token")) -> dict:
+    """
+    Admin dependency that skips token verification and the user lookup for
+    recently verified tokens
+    """
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Invalid authorization header")
+
+    principal = admin_cache.get(token)
+    if principal is not None:
+        admin_cache.hits += 1
+        return principal
+    admin_cache.misses += 1
+
+    try:
+        payload = decode_access_token(token)
+    except Exception:
+        payload = None
+    if not payload or not payload.get("sub"):
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    user = await User.find_one(User.user_id == payload["sub"])
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+
+    principal = {"user_id": user.user_id, "email": user.email, "role": user.role}
+    admin_cache.set(token, principal, payload.get("exp"))
+    return principal
@@ -0,0 +1,270 @@
+"""
+Load test and benchmark for the booking API
+
+Seeds a MongoDB database with rooms, users and bookings, drives concurrent
+traffic against a running API server and writes a JSON report with
+throughput, latency percentiles and Mongo commands per request (read from
+the server's /metrics endpoint) so runs can be compared between commits.
+
+The server must use the same database and must be started after seeding:
+it keeps in-process room and schedule caches that do not see the seed
+rewriting the collections behind it. Seed first, start the server, then
+run the scenarios against the seeded data:
+
+    python -m benchmarks.bench_booking --mongo-uri mongodb://localhost:27017 \\
+        --db booking_bench --seed-only
+    # start the API server on booking_bench
+    python -m benchmarks.bench_booking --mongo-uri mongodb://localhost:27017 \\
+        --db booking_bench --no-seed --base-url http://127.0.0.1:8000 --output bench.json
+
+Requires httpx and motor.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import subprocess
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+
+PERIODS_PER_DAY = 12
+API_PREFIX = "/api"
+
+
+def periods_mask(periods: List[int]) -> int:
+    mask = 0
+    for period in periods:
+        mask |= 1 << (period - 1)
+    return mask
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def seed(db, rooms: int, users: int, bookings: int, days: int) -> dict:
+    """
+    Replace the benchmark collections with generated data
+    Occupancy masks are built alongside the bookings so they stay consistent
+    """
+    for name in ("Room", "User", "Booking", "RoomOccupancy"):
+        await db[name].delete_many({})
+
+    room_ids = [f"B{i:04d}" for i in range(rooms)]
+    await db["Room"].insert_many([
+        {"room_id": room_id, "capacity": random.choice([20, 40, 60, 100]), "room_state": "AVAILABLE",
+         "current_reserved_by_user_id": None, "current_reserved_by_booking_id": None}
+        for room_id in room_ids
+    ])
+
+    emails = [f"student{i}@hcmut.edu.vn" for i in range(users)]
+    await db["User"].insert_many([
+        {"user_id": str(1000000 + i), "user_name": f"Student {i}", "email": email,
+         "phone_number": "0900000000", "password": "", "role": "student"}
+        for i, email in enumerate(emails)
+    ])
+
+    today = datetime.now()
+    dates = [(today + timedelta(days=d)).strftime("%Y-%m-%d") for d in range(-days, days)]
+    occupancy: Dict[tuple, Dict[str, int]] = {}
+    docs = []
+    for i in range(bookings):
+        room_id, date = random.choice(room_ids), random.choice(dates)
+        start = random.randint(1, PERIODS_PER_DAY - 1)
+        periods = [start, start + 1]
+        mask = periods_mask(periods)
+        masks = occupancy.setdefault((room_id, date), {"booked_mask": 0, "in_use_mask": 0})
+        free = not (masks["booked_mask"] | masks["in_use_mask"]) & mask
+        status = "PENDING" if free and date >= today.strftime("%Y-%m-%d") else random.choice(["COMPLETED", "CANCELLED"])
+        if status == "PENDING":
+            masks["booked_mask"] |= mask
+        email = random.choice(emails)
+        docs.append({
+            "booking_id": str(2000000 + i), "room_id": room_id, "student_id": email.split("@")[0],
+            "student_name": "Bench", "purpose": "benchmark", "selected_periods": periods,
+            "date": date, "email": email, "phone": "0900000000", "status": status,
+        })
+    for start in range(0, len(docs), 1000):
+        await db["Booking"].insert_many(docs[start:start + 1000])
+    if occupancy:
+        await db["RoomOccupancy"].insert_many([
+            {"room_id": room_id, "date": date, **masks} for (room_id, date), masks in occupancy.items()
+        ])
+
+    return {"room_ids": room_ids, "emails": emails, "booking_ids": [d["booking_id"] for d in docs]}
+
+
+async def load_seeded(db) -> dict:
+    """
+    Identifiers of previously seeded data, for runs against an already started server
+    """
+    return {
+        "room_ids": [doc["room_id"] async for doc in db["Room"].find({}, {"room_id": 1})],
+        "emails": [doc["email"] async for doc in db["User"].find({}, {"email": 1})],
+        "booking_ids": [doc["booking_id"] async for doc in db["Booking"].find({}, {"booking_id": 1})],
+    }
+
+
+async def scrape_db_calls(client: httpx.AsyncClient) -> Dict[str, int]:
+    """
+    Total Mongo commands per route from the Prometheus endpoint
+    """
+    try:
+        response = await client.get("/metrics")
+    except httpx.HTTPError:
+        return {}
+    totals = {}
+    pattern = re.compile(r'^http_request_db_calls_total\{method="(\w+)",route="([^"]+)"\} (\d+)')
+    for line in response.text.splitlines():
+        match = pattern.match(line)
+        if match:
+            totals[f"{match.group(1)} {match.group(2)}"] = int(match.group(3))
+    return totals
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, make_request, requests: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await make_request()
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    before = await scrape_db_calls(client)
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    after = await scrape_db_calls(client)
+
+    db_calls = sum(after.values()) - sum(before.values())
+    return {
+        "scenario": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "throughput_rps": requests / elapsed if elapsed else None,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "statuses": statuses,
+        # Includes the /metrics scrape itself when instrumentation is enabled
+        "db_calls_per_request": db_calls / requests if after else None,
+    }
+
+
+async def double_booking_check(client: httpx.AsyncClient, db, room_id: str, attempts: int) -> dict:
+    """
+    Fire concurrent bookings for the same room, date and period and verify exactly one wins
+    """
+    date = (datetime.now() + timedelta(days=400)).strftime("%Y-%m-%d")
+    payload = {
+        "room_id": room_id, "student_id": "race", "student_name": "Race", "purpose": "race",
+        "selected_periods": [3], "date": date, "email": "race@hcmut.edu.vn", "phone": "0900000000",
+    }
+    responses = await asyncio.gather(*(
+        client.post(f"{API_PREFIX}/booking/{room_id}", json=payload) for _ in range(attempts)
+    ), return_exceptions=True)
+    accepted = sum(1 for r in responses if isinstance(r, httpx.Response) and r.status_code == 200)
+    stored = await db["Booking"].count_documents({
+        "room_id": room_id, "date": date, "selected_periods": 3, "status": {"$in": ["PENDING", "IN_USE"]}
+    })
+    return {"attempts": attempts, "accepted": accepted, "stored": stored, "ok": accepted == 1 and stored == 1}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+async def main(args):
+    random.seed(args.seed)
+    db = AsyncIOMotorClient(args.mongo_uri)[args.db]
+    if args.no_seed:
+        data = await load_seeded(db)
+    else:
+        data = await seed(db, args.rooms, args.users, args.bookings, args.days)
+    if args.seed_only:
+        print(f"Seeded {len(data['booking_ids'])} bookings, start the server before running the scenarios")
+        return
+    today = datetime.now().strftime("%Y-%m-%d")
+    future = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
+
+    def create_booking():
+        room_id = random.choice(data["room_ids"])
+        period = random.randint(1, PERIODS_PER_DAY)
+        return client.post(f"{API_PREFIX}/booking/{room_id}", json={
+            "room_id": room_id, "student_id": "bench", "student_name": "Bench", "purpose": "benchmark",
+            "selected_periods": [period], "date": future, "email": random.choice(data["emails"]),
+            "phone": "0900000000",
+        })
+
+    scenarios = {
+        "get_room_schedules": lambda: client.get(f"{API_PREFIX}/room/schedules", params={"date": today}),
+        "get_user_calendar": lambda: client.get(
+            f"{API_PREFIX}/booking/calendar/user", params={"email": random.choice(data["emails"])}),
+        "create_booking_room": create_booking,
+        "get_booking_qr": lambda: client.get(f"{API_PREFIX}/booking/{random.choice(data['booking_ids'])}/qr"),
+        "checkin_booking_by_qr": lambda: client.post(
+            f"{API_PREFIX}/booking/checkin/qr",
+            params={"qr_data": f"{random.choice(data['booking_ids'])}|{random.choice(data['emails'])}"}),
+    }
+
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(),
+        "config": vars(args),
+        "results": [],
+    }
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30) as client:
+        for name, make_request in scenarios.items():
+            if args.scenarios and name not in args.scenarios:
+                continue
+            result = await run_scenario(client, name, make_request, args.requests, args.concurrency)
+            report["results"].append(result)
+            print(f"{name:24s} {result['throughput_rps']:8.1f} rps  p50 {result['p50_ms']:7.1f}ms  "
+                  f"p95 {result['p95_ms']:7.1f}ms  p99 {result['p99_ms']:7.1f}ms")
+
+        report["double_booking"] = await double_booking_check(client, db, data["room_ids"][0], args.race_attempts)
+        print(f"double booking check: {report['double_booking']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="booking_bench")
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--bookings", type=int, default=50000)
+    parser.add_argument("--days", type=int, default=60, help="Bookings are spread over +/- this many days")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--race-attempts", type=int, default=300)
+    parser.add_argument("--scenarios", nargs="*", help="Only run these scenarios")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--seed-only", action="store_true", help="Seed the database and exit")
+    parser.add_argument("--no-seed", action="store_true", help="Reuse data seeded by an earlier --seed-only run")
+    parser.add_argument("--output", help="Write the JSON report here")
+    asyncio.run(main(parser.parse_args()))
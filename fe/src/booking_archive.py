@@ -0,0 +1,194 @@
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional, Tuple
+from pymongo import DESCENDING
+from pymongo.errors import BulkWriteError
+from const import BookingState
+from models.booking import Booking, BookingSummary, DATE_FORMAT, parse_booking_date
+
+logger = logging.getLogger(__name__)
+
+# Finished bookings older than this many days leave the hot Booking collection
+ARCHIVE_HORIZON_DAYS = int(os.getenv("ARCHIVE_HORIZON_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_STATUSES = [BookingState.COMPLETED, BookingState.CANCELLED]
+
+ARCHIVE_PREFIX = "BookingArchive_"
+ARCHIVE_META = "BookingArchiveMeta"
+# Seconds the archive meta is kept in-process, it only changes once a day
+ARCHIVE_META_TTL = int(os.getenv("ARCHIVE_META_TTL", "300"))
+
+_meta_cache = {"value": None, "expires_at": 0.0}
+
+
+def archive_term(date: datetime) -> str:
+    """
+    Term a booking date belongs to: first (Jan-Jun) or second (Jul-Dec) half of the year
+    """
+    return f"{date.year}_{1 if date.month <= 6 else 2}"
+
+
+def term_bounds(term: str) -> Tuple[str, str]:
+    year, half = term.split("_")
+    return (f"{year}-01-01", f"{year}-06-30") if half == "1" else (f"{year}-07-01", f"{year}-12-31")
+
+
+def get_database():
+    return Booking.get_motor_collection().database
+
+
+async def get_archive_meta(refresh: bool = False) -> dict:
+    if refresh or _meta_cache["value"] is None or _meta_cache["expires_at"] < time.monotonic():
+        meta = await get_database()[ARCHIVE_META].find_one({"_id": "archive"})
+        _meta_cache["value"] = meta or {"archived_before": None, "terms": []}
+        _meta_cache["expires_at"] = time.monotonic() + ARCHIVE_META_TTL
+    return _meta_cache["value"]
+
+
+async def archive_bookings(now: Optional[datetime] = None, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move COMPLETED/CANCELLED bookings older than the horizon into per-term archive collections
+    Each batch is copied before it is deleted, and re-copying an already archived
+    document is ignored, so an interrupted run can simply be repeated.
+    """
+    now = now or datetime.now()
+    cutoff = (now - timedelta(days=ARCHIVE_HORIZON_DAYS)).strftime(DATE_FORMAT)
+    db = get_database()
+    hot = Booking.get_motor_collection()
+    # Only bookings with a typed date: legacy documents with a missing or
+    # unparsable date string stay in the hot collection
+    query = {"status": {"$in": ARCHIVE_STATUSES}, "booking_date": {"$lt": parse_booking_date(cutoff)}}
+
+    moved = 0
+    terms = set()
+    while True:
+        docs = await hot.find(query).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+
+        by_term = {}
+        for doc in docs:
+            by_term.setdefault(archive_term(doc["booking_date"]), []).append(doc)
+        for term, term_docs in by_term.items():
+            try:
+                await db[ARCHIVE_PREFIX + term].insert_many(term_docs, ordered=False)
+            except BulkWriteError as e:
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+            terms.add(term)
+
+        result = await hot.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        moved += result.deleted_count
+
+    for term in terms:
+        await db[ARCHIVE_PREFIX + term].create_index([("date", DESCENDING), ("booking_id", DESCENDING)])
+        await db[ARCHIVE_PREFIX + term].create_index([("email", 1), ("date", DESCENDING)])
+        await db[ARCHIVE_PREFIX + term].create_index([("student_id", 1), ("date", DESCENDING)])
+        await db[ARCHIVE_PREFIX + term].create_index([("room_id", 1), ("date", DESCENDING)])
+
+    await db[ARCHIVE_META].update_one(
+        {"_id": "archive"},
+        {"$max": {"archived_before": cutoff}, "$addToSet": {"terms": {"$each": sorted(terms)}}},
+        upsert=True,
+    )
+    await get_archive_meta(refresh=True)
+    logger.info("Archived %d bookings older than %s", moved, cutoff)
+    return moved
+
+
+async def archive_collections(from_date: Optional[str] = None, to_date: Optional[str] = None) -> list:
+    """
+    Archive term collections overlapping a date range, empty when the range
+    does not reach below the archive horizon
+    """
+    meta = await get_archive_meta()
+    archived_before = meta["archived_before"]
+    if not archived_before or (from_date and from_date >= archived_before):
+        return []
+
+    db = get_database()
+    collections = []
+    for term in meta["terms"]:
+        start, end = term_bounds(term)
+        if (from_date and end < from_date) or (to_date and start > to_date):
+            continue
+        collections.append(db[ARCHIVE_PREFIX + term])
+    return collections
+
+
+def sort_key(booking: BookingSummary, sort: List[Tuple[str, int]]) -> tuple:
+    return tuple(getattr(booking, field) or "" for field, _ in sort)
+
+
+def comes_before(a: BookingSummary, b: BookingSummary, sort: List[Tuple[str, int]]) -> bool:
+    for field, direction in sort:
+        value_a, value_b = getattr(a, field) or "", getattr(b, field) or ""
+        if value_a != value_b:
+            return value_a > value_b if direction == DESCENDING else value_a < value_b
+    return False
+
+
+async def merge_sorted(streams: List[AsyncIterator[BookingSummary]], sort: List[Tuple[str, int]]) -> AsyncIterator[BookingSummary]:
+    """
+    Merge streams that are each ordered by sort into one ordered stream
+    A booking seen in both the hot and an archive collection (archival copies
+    before it deletes) is yielded once.
+    """
+    heads = {}
+    for i, stream in enumerate(streams):
+        async for booking in stream:
+            heads[i] = booking
+            break
+
+    previous = None
+    while heads:
+        i = next(iter(heads))
+        for j in heads:
+            if comes_before(heads[j], heads[i], sort):
+                i = j
+        booking = heads.pop(i)
+        if previous is None or sort_key(booking, sort) != previous:
+            previous = sort_key(booking, sort)
+            yield booking
+
+        async for booking in streams[i]:
+            heads[i] = booking
+            break
+
+
+async def stream_archived(collection, query: dict, sort: List[Tuple[str, int]]) -> AsyncIterator[BookingSummary]:
+    async for doc in collection.find(query, {"qr_code": 0}).sort(sort):
+        yield BookingSummary.parse_obj(doc)
+
+
+async def with_archived(
+    hot: List[BookingSummary],
+    query: dict,
+    sort: List[Tuple[str, int]],
+    limit: int,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+) -> List[BookingSummary]:
+    """
+    Complete a page read from the hot collection with archived bookings
+    The archive is only read when the requested range reaches below the archive
+    horizon and the hot page does not already end above it.
+    """
+    meta = await get_archive_meta()
+    archived_before = meta["archived_before"]
+    if len(hot) >= limit and archived_before and hot[-1].date >= archived_before:
+        return hot
+
+    archived = []
+    for collection in await archive_collections(from_date, to_date):
+        docs = await collection.find(query, {"qr_code": 0}).sort(sort).limit(limit).to_list(limit)
+        archived.extend(BookingSummary.parse_obj(doc) for doc in docs)
+    if not archived:
+        return hot
+
+    merged = hot + archived
+    for field, direction in reversed(sort):
+        merged.sort(key=lambda booking: getattr(booking, field) or "", reverse=direction == DESCENDING)
+    return merged[:limit]
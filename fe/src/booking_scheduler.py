@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+import pytz
+from bson import ObjectId
+from pymongo import UpdateOne
+from const import BookingState
+from models.booking import Booking, booking_date_filter
+from models.occupancy import PERIODS_PER_DAY, apply_transition
+from routers.booking import get_period_time_range
+from booking_archive import archive_bookings
+from room_analytics import rollup_days
+from metrics import register_collector
+from concurrency import get_revision, revision_filter
+
+logger = logging.getLogger(__name__)
+
+GMT7 = pytz.timezone('Asia/Bangkok')
+
+# Hour (GMT+7) at which finished bookings are moved to the archive
+ARCHIVE_HOUR = 0
+
+# Seconds after a period boundary before sweeping, so the period has really ended
+SWEEP_DELAY_SECONDS = 5
+
+# Bookings transitioned per update_many
+SWEEP_BATCH_SIZE = 500
+
+# PENDING bookings never checked in are no-shows, IN_USE ones are finished sessions
+# (old status, new status, extra fields set by the sweep)
+SWEEP_TRANSITIONS = [
+    (BookingState.PENDING, BookingState.CANCELLED, {"no_show": True}),
+    (BookingState.IN_USE, BookingState.COMPLETED, {}),
+]
+
+sweep_metrics = {
+    "runs": 0,
+    "last_run_at": None,
+    "last_duration_seconds": None,
+    "total_duration_seconds": 0.0,
+    "last_rows": {},
+    "total_rows": {new_status: 0 for _, new_status, _ in SWEEP_TRANSITIONS},
+}
+
+
+def last_ended_period(now: datetime) -> int:
+    """
+    Highest period number whose time range has ended at `now`
+    """
+    ended = 0
+    for period in range(1, PERIODS_PER_DAY + 1):
+        _, end_hour = get_period_time_range(period)
+        if end_hour <= now.hour:
+            ended = period
+    return ended
+
+
+def finished_bookings_query(status: str, now: datetime) -> dict:
+    """
+    Bookings in `status` whose every selected period has ended
+    """
+    today = now.strftime("%Y-%m-%d")
+    return {
+        "status": status,
+        "$or": [
+            booking_date_filter(lt=today),
+            {
+                **booking_date_filter(gte=today, lte=today),
+                "selected_periods": {"$not": {"$elemMatch": {"$gt": last_ended_period(now)}}},
+            },
+        ],
+    }
+
+
+async def sweep_status(old_status: str, new_status: str, extra_fields: dict, now: datetime) -> int:
+    query = finished_bookings_query(old_status, now)
+    collection = Booking.get_motor_collection()
+    # Tags the documents this sweep changes, to release occupancy only for those
+    sweep_id = str(ObjectId())
+    modified = 0
+    batch: List[dict] = []
+
+    async def flush():
+        nonlocal modified
+        # Each booking is guarded on the revision that was read, so a concurrent
+        # checkin/checkout/cancel or a reschedule by PUT wins over the sweep
+        operations = [
+            UpdateOne(
+                {"_id": doc["_id"], "status": old_status, "revision": revision_filter(get_revision(doc))},
+                {"$set": {"status": new_status, "sweep_id": sweep_id, **extra_fields}, "$inc": {"revision": 1}},
+            )
+            for doc in batch
+        ]
+        await collection.bulk_write(operations, ordered=False)
+        swept = {
+            doc["_id"]
+            async for doc in collection.find(
+                {"_id": {"$in": [doc["_id"] for doc in batch]}, "sweep_id": sweep_id}, {"_id": 1}
+            )
+        }
+        modified += len(swept)
+
+        # Release the periods of the swept bookings per room and date in the occupancy masks
+        released: Dict[Tuple[str, str], set] = {}
+        for doc in batch:
+            if doc["_id"] in swept:
+                released.setdefault((doc.get("room_id"), doc.get("date")), set()).update(doc.get("selected_periods") or [])
+        for (room_id, date), periods in released.items():
+            await apply_transition(room_id, date, sorted(periods), old_status, new_status)
+        batch.clear()
+
+    async for doc in collection.find(query, {"room_id": 1, "date": 1, "selected_periods": 1, "revision": 1}):
+        batch.append(doc)
+        if len(batch) >= SWEEP_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+    return modified
+
+
+async def sweep_bookings(now: datetime = None) -> Dict[str, int]:
+    """
+    Expire no-show PENDING bookings and complete finished IN_USE bookings
+    """
+    now = now or datetime.now(GMT7)
+    started = time.perf_counter()
+
+    rows = {}
+    for old_status, new_status, extra_fields in SWEEP_TRANSITIONS:
+        rows[new_status] = await sweep_status(old_status, new_status, extra_fields, now)
+
+    # Refresh the utilization rollup of the day the sweep just changed
+    await rollup_days([now.strftime("%Y-%m-%d")])
+
+    duration = time.perf_counter() - started
+    sweep_metrics["runs"] += 1
+    sweep_metrics["last_run_at"] = now.isoformat()
+    sweep_metrics["last_duration_seconds"] = duration
+    sweep_metrics["total_duration_seconds"] += duration
+    sweep_metrics["last_rows"] = rows
+    for status, count in rows.items():
+        sweep_metrics["total_rows"][status] += count
+
+    logger.info("Booking sweep took %.3fs, rows: %s", duration, rows)
+    return rows
+
+
+def sweep_metric_families():
+    yield ("booking_sweep_runs_total", "counter", "Completed booking sweeps",
+           [({}, sweep_metrics["runs"])])
+    yield ("booking_sweep_seconds_total", "counter", "Time spent in booking sweeps",
+           [({}, sweep_metrics["total_duration_seconds"])])
+    yield ("booking_sweep_last_duration_seconds", "gauge", "Duration of the last booking sweep",
+           [({}, sweep_metrics["last_duration_seconds"] or 0)])
+    yield ("booking_sweep_rows_total", "counter", "Bookings transitioned by the sweep, by new status",
+           [({"status": status}, count) for status, count in sweep_metrics["total_rows"].items()])
+
+
+register_collector(sweep_metric_families)
+
+
+def seconds_until_next_boundary(now: datetime) -> float:
+    # Periods start and end on the hour
+    next_boundary = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return (next_boundary - now).total_seconds() + SWEEP_DELAY_SECONDS
+
+
+async def run_booking_scheduler():
+    # Sweep once on startup to catch up on periods that ended while the app was down,
+    # then at every period boundary
+    while True:
+        try:
+            await sweep_bookings()
+        except Exception:
+            logger.exception("Booking sweep failed")
+        if datetime.now(GMT7).hour == ARCHIVE_HOUR:
+            try:
+                # Final rollup of the day that just ended, before its bookings can be archived
+                await rollup_days([(datetime.now(GMT7) - timedelta(days=1)).strftime("%Y-%m-%d")])
+                await archive_bookings()
+            except Exception:
+                logger.exception("Booking archival failed")
+        await asyncio.sleep(seconds_until_next_boundary(datetime.now(GMT7)))
+
+
+@asynccontextmanager
+async def booking_scheduler_lifespan(app):
+    """
+    Run the sweeper for the lifetime of the app, e.g. FastAPI(lifespan=booking_scheduler_lifespan)
+    """
+    task = asyncio.create_task(run_booking_scheduler())
+    try:
+        yield
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
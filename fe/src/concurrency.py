@@ -0,0 +1,34 @@
+from typing import Optional
+from fastapi import HTTPException
+
+# Optimistic concurrency helpers for documents carrying a "revision" counter
+# Documents written before the counter existed have no field and count as revision 0
+
+
+def get_revision(doc: dict) -> int:
+    return doc.get("revision") or 0
+
+
+def revision_filter(revision: int):
+    return {"$in": [0, None]} if revision == 0 else revision
+
+
+def revision_etag(revision: int) -> str:
+    return f'"{revision}"'
+
+
+def check_if_match(if_match: Optional[str], revision: int):
+    """
+    Reject the update with 412 if the client's If-Match is not the current revision
+    """
+    if if_match is not None and if_match not in ("*", revision_etag(revision), str(revision)):
+        raise HTTPException(status_code=412, detail="Resource was modified, reload and try again")
+
+
+def raise_modified(if_match: Optional[str]):
+    """
+    The conditional write matched nothing because another request changed the document first
+    """
+    if if_match is not None:
+        raise HTTPException(status_code=412, detail="Resource was modified, reload and try again")
+    raise HTTPException(status_code=409, detail="Resource was modified concurrently, please retry")
@@ -0,0 +1,74 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import DuplicateKeyError
+from models.idempotency import IdempotencyRecord, IdempotencyState, IDEMPOTENCY_LEASE_SECONDS
+
+
+def request_fingerprint(*args: Any) -> str:
+    payload = json.dumps(jsonable_encoder(args), sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+async def reclaim_abandoned(record: IdempotencyRecord) -> bool:
+    """
+    Take over an IN_PROGRESS record whose lease expired, returns False if it
+    is still fresh or another retry took it over first
+    """
+    now = datetime.utcnow()
+    if record.created_at > now - timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS):
+        return False
+    result = await IdempotencyRecord.get_motor_collection().update_one(
+        {"_id": record.id, "state": IdempotencyState.IN_PROGRESS, "created_at": record.created_at},
+        {"$set": {"created_at": now}},
+    )
+    if not result.modified_count:
+        return False
+    record.created_at = now
+    return True
+
+
+async def run_idempotent(
+    key: Optional[str],
+    scope: str,
+    fingerprint: str,
+    operation: Callable[[], Awaitable[Any]],
+) -> Any:
+    """
+    Run operation once per (Idempotency-Key, scope)
+    Retries with the same key get the stored response without redoing the writes.
+    A retry that arrives while the first call is still running gets 409, and a
+    key reused with different arguments gets 422. Failed calls are forgotten so
+    they can be retried, and calls whose worker died are retried once their
+    lease expires.
+    """
+    if not key:
+        return await operation()
+
+    record = IdempotencyRecord(key=key, scope=scope, fingerprint=fingerprint, created_at=datetime.utcnow())
+    try:
+        await record.insert()
+    except DuplicateKeyError:
+        existing = await IdempotencyRecord.find_one({"key": key, "scope": scope})
+        if existing is None:
+            # Expired between the insert and the lookup, treat as a new request
+            return await run_idempotent(key, scope, fingerprint, operation)
+        if existing.fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with different parameters")
+        if existing.state == IdempotencyState.DONE:
+            return existing.response
+        if not await reclaim_abandoned(existing):
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        record = existing
+
+    try:
+        result = await operation()
+    except BaseException:
+        await record.delete()
+        raise
+
+    await record.set({"state": IdempotencyState.DONE, "response": jsonable_encoder(result)})
+    return result
@@ -0,0 +1,226 @@
+import bisect
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this are logged with their DB call breakdown
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1.0"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    __slots__ = ("db_calls", "db_seconds", "commands")
+
+    def __init__(self):
+        self.db_calls = 0
+        self.db_seconds = 0.0
+        self.commands: Dict[str, int] = {}
+
+
+# Stats of the request being served, None outside requests
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        # (method, route, status) -> latency histogram
+        self.request_latency: Dict[Tuple[str, str, int], Histogram] = {}
+        # (method, route) -> totals
+        self.request_db_calls: Dict[Tuple[str, str], int] = {}
+        self.request_db_seconds: Dict[Tuple[str, str], float] = {}
+        # Mongo command name -> totals, across all requests and background tasks
+        self.db_commands: Dict[str, int] = {}
+        self.db_command_seconds: Dict[str, float] = {}
+        self.db_command_failures: Dict[str, int] = {}
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        self.request_latency.setdefault((method, route, status), Histogram()).observe(seconds)
+        key = (method, route)
+        self.request_db_calls[key] = self.request_db_calls.get(key, 0) + stats.db_calls
+        self.request_db_seconds[key] = self.request_db_seconds.get(key, 0.0) + stats.db_seconds
+
+
+registry = Registry()
+
+# A metric family: (name, type, help, [(labels, value), ...])
+Family = Tuple[str, str, str, List[Tuple[dict, float]]]
+
+# Callbacks of other modules (scheduler, caches, ...) exposing their own families
+collectors: List[Callable[[], Iterable[Family]]] = []
+
+
+def register_collector(collector: Callable[[], Iterable[Family]]):
+    collectors.append(collector)
+
+
+class DbCommandListener(monitoring.CommandListener):
+    """
+    Counts Mongo commands and their duration, globally and for the current request
+    Motor copies the context into its executor threads, so current_request
+    resolves to the request that issued the command.
+    """
+
+    def started(self, event):
+        stats = current_request.get()
+        if stats is not None:
+            stats.db_calls += 1
+            stats.commands[event.command_name] = stats.commands.get(event.command_name, 0) + 1
+
+    def _finished(self, event, failed: bool):
+        seconds = event.duration_micros / 1e6
+        name = event.command_name
+        registry.db_commands[name] = registry.db_commands.get(name, 0) + 1
+        registry.db_command_seconds[name] = registry.db_command_seconds.get(name, 0.0) + seconds
+        if failed:
+            registry.db_command_failures[name] = registry.db_command_failures.get(name, 0) + 1
+        stats = current_request.get()
+        if stats is not None:
+            stats.db_seconds += seconds
+
+    def succeeded(self, event):
+        self._finished(event, failed=False)
+
+    def failed(self, event):
+        self._finished(event, failed=True)
+
+
+def register_db_listener():
+    """
+    Must run before the Motor client is created
+    """
+    monitoring.register(DbCommandListener())
+
+
+def is_streamed(response) -> bool:
+    """
+    Long-lived responses (SSE, file exports) whose duration is not a latency
+    """
+    headers = response.headers
+    return (
+        headers.get("content-type", "").startswith("text/event-stream")
+        or headers.get("content-disposition", "").startswith("attachment")
+    )
+
+
+async def metrics_middleware(request: Request, call_next):
+    stats = RequestStats()
+    token = current_request.set(stats)
+    started = time.perf_counter()
+    status = 500
+    streamed = False
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        streamed = is_streamed(response)
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        current_request.reset(token)
+        if not streamed:
+            record_request(request, status, elapsed, stats)
+
+
+def record_request(request: Request, status: int, elapsed: float, stats: RequestStats):
+    route = request.scope.get("route")
+    # Use the route template so /booking/{booking_id} is one series
+    path = route.path if route is not None else "unmatched"
+    registry.observe_request(request.method, path, status, elapsed, stats)
+    if elapsed >= SLOW_REQUEST_SECONDS:
+        logger.warning(
+            "Slow request %s %s: %.3fs, %d DB calls (%.3fs) %s",
+            request.method, request.url.path, elapsed, stats.db_calls, stats.db_seconds, stats.commands,
+        )
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def render_prometheus() -> str:
+    lines = [
+        "# HELP http_request_duration_seconds Request latency by route",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, route, status), histogram in sorted(registry.request_latency.items()):
+        labels = _labels(method=method, route=route, status=status)
+        cumulative = 0
+        for bucket, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bucket}"}} {cumulative}')
+        lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"http_request_duration_seconds_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"http_request_duration_seconds_count{{{labels}}} {histogram.count}")
+
+    lines += [
+        "# HELP http_request_db_calls_total Mongo commands issued while serving a route",
+        "# TYPE http_request_db_calls_total counter",
+    ]
+    for (method, route), count in sorted(registry.request_db_calls.items()):
+        lines.append(f"http_request_db_calls_total{{{_labels(method=method, route=route)}}} {count}")
+
+    lines += [
+        "# HELP http_request_db_seconds_total Time spent in Mongo commands while serving a route",
+        "# TYPE http_request_db_seconds_total counter",
+    ]
+    for (method, route), seconds in sorted(registry.request_db_seconds.items()):
+        lines.append(f"http_request_db_seconds_total{{{_labels(method=method, route=route)}}} {seconds}")
+
+    commands = sorted(registry.db_commands)
+    families = [
+        ("mongodb_commands_total", "counter", "Mongo commands by name",
+         [({"command": name}, registry.db_commands[name]) for name in commands]),
+        ("mongodb_command_failures_total", "counter", "Failed Mongo commands by name",
+         [({"command": name}, registry.db_command_failures.get(name, 0)) for name in commands]),
+        ("mongodb_command_seconds_total", "counter", "Time spent in Mongo commands by name",
+         [({"command": name}, registry.db_command_seconds[name]) for name in commands]),
+    ]
+    for collector in collectors:
+        families.extend(collector())
+
+    # Each family is emitted as one group under its own HELP/TYPE lines
+    for name, kind, help_text, samples in families:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for labels, value in samples:
+            lines.append(f"{name}{{{_labels(**labels)}}} {value}" if labels else f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return render_prometheus()
+
+
+def install_metrics(app):
+    """
+    Wire request instrumentation and the /metrics endpoint into the app
+    """
+    register_db_listener()
+    app.middleware("http")(metrics_middleware)
+    app.include_router(router)
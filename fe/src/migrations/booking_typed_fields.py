@@ -0,0 +1,98 @@
+"""
+Backfill the typed Booking fields (booking_date, period_mask) in place
+
+Streams the Booking collection with a server-side cursor and writes one
+unordered bulk_write per batch, so memory stays bounded regardless of
+collection size. selected_periods are normalised (sorted, de-duplicated,
+out-of-range values dropped); documents with an unparsable date are
+reported and left untouched. Safe to re-run: only documents missing the
+typed fields are visited unless --all is given.
+
+With --rebuild-occupancy the RoomOccupancy masks of every room and date
+with active bookings are recomputed from the migrated data.
+
+    python -m migrations.booking_typed_fields --mongo-uri mongodb://localhost:27017 --db booking
+"""
+import argparse
+import asyncio
+import logging
+from typing import Dict, Tuple
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from models.booking import PERIODS_PER_DAY, booking_typed_fields
+
+logger = logging.getLogger("migrations.booking_typed_fields")
+
+ACTIVE_FIELDS = {"PENDING": "booked_mask", "IN_USE": "in_use_mask"}
+
+
+async def migrate(db, batch_size: int, migrate_all: bool, dry_run: bool, rebuild_occupancy: bool) -> dict:
+    bookings = db["Booking"]
+    query = {} if migrate_all else {"$or": [{"booking_date": {"$exists": False}}, {"period_mask": {"$exists": False}}]}
+    projection = {"date": 1, "selected_periods": 1, "room_id": 1, "status": 1}
+
+    stats = {"scanned": 0, "updated": 0, "invalid_date": 0, "fixed_periods": 0}
+    occupancy: Dict[Tuple[str, str], Dict[str, int]] = {}
+    batch = []
+
+    async def flush():
+        if batch and not dry_run:
+            result = await bookings.bulk_write(batch, ordered=False)
+            stats["updated"] += result.modified_count
+        batch.clear()
+
+    async for doc in bookings.find(query, projection, batch_size=batch_size):
+        stats["scanned"] += 1
+        fields = booking_typed_fields(doc.get("date"), doc.get("selected_periods") or [])
+        if fields["booking_date"] is None:
+            stats["invalid_date"] += 1
+            logger.warning("Booking %s has invalid date %r, skipped", doc["_id"], doc.get("date"))
+            continue
+
+        stored = doc.get("selected_periods") or []
+        periods = sorted({p for p in stored if isinstance(p, int) and 1 <= p <= PERIODS_PER_DAY})
+        if periods != stored:
+            stats["fixed_periods"] += 1
+        batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {**fields, "selected_periods": periods}}))
+
+        field = ACTIVE_FIELDS.get(doc.get("status"))
+        if rebuild_occupancy and field:
+            masks = occupancy.setdefault((doc.get("room_id"), doc.get("date")), {"booked_mask": 0, "in_use_mask": 0})
+            masks[field] |= fields["period_mask"]
+
+        if len(batch) >= batch_size:
+            await flush()
+            logger.info("Progress: %s", stats)
+    await flush()
+
+    if rebuild_occupancy:
+        if not migrate_all:
+            logger.warning("--rebuild-occupancy only sees visited documents, combine it with --all")
+        operations = [
+            UpdateOne({"room_id": room_id, "date": date}, {"$set": masks}, upsert=True)
+            for (room_id, date), masks in occupancy.items()
+        ]
+        for start in range(0, len(operations), batch_size):
+            if not dry_run:
+                await db["RoomOccupancy"].bulk_write(operations[start:start + batch_size], ordered=False)
+        stats["occupancy_rebuilt"] = len(operations)
+
+    return stats
+
+
+async def main(args):
+    db = AsyncIOMotorClient(args.mongo_uri)[args.db]
+    stats = await migrate(db, args.batch_size, args.all, args.dry_run, args.rebuild_occupancy)
+    logger.info("Done%s: %s", " (dry run)" if args.dry_run else "", stats)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--all", action="store_true", help="Revisit documents that already have the typed fields")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--rebuild-occupancy", action="store_true")
+    asyncio.run(main(parser.parse_args()))
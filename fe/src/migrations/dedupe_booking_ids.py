@@ -0,0 +1,62 @@
+"""
+Give duplicate booking_ids a fresh random id so booking_id_unique can be built
+
+Random 7-digit booking_ids collided before the unique index existed. For
+every duplicated id the oldest booking (smallest _id) keeps it and the
+others get a new id that is not used by any booking. QR codes of the
+renamed bookings change with their id. Safe to re-run: once there are no
+duplicates it does nothing.
+
+    python -m migrations.dedupe_booking_ids --mongo-uri mongodb://localhost:27017 --db booking
+"""
+import argparse
+import asyncio
+import logging
+import random
+from motor.motor_asyncio import AsyncIOMotorClient
+
+logger = logging.getLogger("migrations.dedupe_booking_ids")
+
+
+async def free_booking_id(bookings, taken: set) -> str:
+    while True:
+        booking_id = str(random.randint(1000000, 9999999))
+        if booking_id not in taken and not await bookings.find_one({"booking_id": booking_id}, {"_id": 1}):
+            taken.add(booking_id)
+            return booking_id
+
+
+async def dedupe(db, dry_run: bool) -> dict:
+    bookings = db["Booking"]
+    pipeline = [
+        {"$match": {"booking_id": {"$type": "string"}}},
+        {"$group": {"_id": "$booking_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+
+    stats = {"duplicated_ids": 0, "renamed": 0}
+    taken = set()
+    async for group in bookings.aggregate(pipeline, allowDiskUse=True):
+        stats["duplicated_ids"] += 1
+        for _id in sorted(group["ids"])[1:]:
+            booking_id = await free_booking_id(bookings, taken)
+            logger.info("Booking %s: booking_id %s -> %s", _id, group["_id"], booking_id)
+            if not dry_run:
+                await bookings.update_one({"_id": _id}, {"$set": {"booking_id": booking_id}, "$inc": {"revision": 1}})
+            stats["renamed"] += 1
+    return stats
+
+
+async def main(args):
+    db = AsyncIOMotorClient(args.mongo_uri)[args.db]
+    stats = await dedupe(db, args.dry_run)
+    logger.info("Done%s: %s", " (dry run)" if args.dry_run else "", stats)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--dry-run", action="store_true")
+    asyncio.run(main(parser.parse_args()))
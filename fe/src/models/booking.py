@@ -1,6 +1,82 @@
 from beanie import Document
-from pydantic import BaseModel
-from typing import Optional, List
+from datetime import datetime
+from pydantic import BaseModel, Field, validator, root_validator
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from typing import Iterable, Optional, List
+
+DATE_FORMAT = "%Y-%m-%d"
+
+PERIODS_PER_DAY = 12  # Period 1 (6:00) .. period 12 (17:00)
+
+# Maximum number of bookings created by one bulk request
+MAX_BULK_SLOTS = 60
+
+
+def periods_to_mask(periods: Iterable[int]) -> int:
+    """
+    Convert a list of period numbers (1-based) to a bitmask
+    Period 1 -> bit 0, period 12 -> bit 11
+    """
+    mask = 0
+    for period in periods:
+        if not 1 <= period <= PERIODS_PER_DAY:
+            raise ValueError(f"Invalid period {period}, must be between 1 and {PERIODS_PER_DAY}")
+        mask |= 1 << (period - 1)
+    return mask
+
+
+def stored_periods_mask(periods: Optional[Iterable[int]]) -> int:
+    """
+    Mask of already stored selected_periods, ignoring out-of-range values
+    """
+    return periods_to_mask(period for period in periods or [] if 1 <= period <= PERIODS_PER_DAY)
+
+
+def mask_to_periods(mask: int) -> List[int]:
+    return [period for period in range(1, PERIODS_PER_DAY + 1) if mask & (1 << (period - 1))]
+
+
+def parse_booking_date(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.strptime(value, DATE_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def booking_date_filter(**bounds: str) -> dict:
+    """
+    Range filter on the typed booking_date, e.g. booking_date_filter(lt="2024-01-01")
+    Documents the migration has not reached yet fall back to the date string
+    """
+    typed = {f"${op}": parse_booking_date(value) for op, value in bounds.items()}
+    legacy = {f"${op}": value for op, value in bounds.items()}
+    return {"$or": [{"booking_date": typed}, {"booking_date": None, "date": legacy}]}
+
+
+def booking_typed_fields(date: Optional[str], periods: Optional[Iterable[int]]) -> dict:
+    """
+    Typed fields derived from the date string and selected_periods
+    """
+    return {
+        "booking_date": parse_booking_date(date),
+        "period_mask": stored_periods_mask(periods) if periods is not None else None,
+    }
+
+
+def validate_date(value: Optional[str]) -> Optional[str]:
+    if value is not None and parse_booking_date(value) is None:
+        raise ValueError("date must be a valid YYYY-MM-DD date")
+    return value
+
+
+def validate_periods(value: Optional[List[int]]) -> Optional[List[int]]:
+    if value is None:
+        return value
+    if not value:
+        raise ValueError("at least one period must be selected")
+    periods_to_mask(value)
+    return sorted(set(value))
+
 
 class CreateBookingRequest(BaseModel):
     room_id: str
@@ -12,6 +88,9 @@ class CreateBookingRequest(BaseModel):
     email: str
     phone: str
 
+    _check_date = validator("date", allow_reuse=True)(validate_date)
+    _check_periods = validator("selected_periods", allow_reuse=True)(validate_periods)
+
 
 class UpdateBookingRequest(BaseModel):
     room_id: Optional[str] = None
@@ -24,6 +103,61 @@ class UpdateBookingRequest(BaseModel):
     phone: Optional[str] = None
     status: Optional[str] = None
 
+    _check_date = validator("date", allow_reuse=True)(validate_date)
+    _check_periods = validator("selected_periods", allow_reuse=True)(validate_periods)
+
+
+class BookingSlot(BaseModel):
+    date: str
+    selected_periods: List[int]
+
+    _check_date = validator("date", allow_reuse=True)(validate_date)
+    _check_periods = validator("selected_periods", allow_reuse=True)(validate_periods)
+
+
+class RecurrenceRule(BaseModel):
+    start_date: str
+    selected_periods: List[int]
+    count: int = Field(..., ge=1, le=MAX_BULK_SLOTS)  # Number of occurrences
+    interval_weeks: int = Field(1, ge=1)
+
+    _check_date = validator("start_date", allow_reuse=True)(validate_date)
+    _check_periods = validator("selected_periods", allow_reuse=True)(validate_periods)
+
+
+class BulkBookingRequest(BaseModel):
+    student_id: str
+    student_name: str
+    purpose: str
+    email: str
+    phone: str
+    slots: Optional[List[BookingSlot]] = Field(None, max_items=MAX_BULK_SLOTS)
+    recurrence: Optional[RecurrenceRule] = None
+
+
+class BulkBookingResult(BaseModel):
+    date: str
+    selected_periods: List[int]
+    success: bool
+    booking_id: Optional[str] = None
+    detail: Optional[str] = None
+
+
+class BookingSummary(BaseModel):
+    """
+    Booking without heavy fields (qr_code), used as a projection for list views
+    """
+    booking_id: Optional[str] = None
+    room_id: Optional[str] = None
+    student_id: Optional[str] = None
+    student_name: Optional[str] = None
+    purpose: Optional[str] = None
+    selected_periods: Optional[List[int]] = None
+    date: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    status: Optional[str] = None
+
 
 class Booking(Document):
     booking_id: Optional[str] = None
@@ -36,7 +170,45 @@ class Booking(Document):
     email: Optional[str] = None
     phone: Optional[str] = None
     status: Optional[str] = None
-    qr_code: Optional[str] = None  # Base64 encoded QR code
+    qr_code: Optional[str] = None  # Legacy base64 QR code, now served by GET /booking/{booking_id}/qr
+    revision: Optional[int] = 0  # Bumped on every PUT, exposed as ETag for If-Match
+    no_show: Optional[bool] = None  # Set when the scheduler cancels a booking nobody checked in to
+    sweep_id: Optional[str] = None  # Scheduler sweep that closed the booking
+    booking_date: Optional[datetime] = None  # date as midnight datetime, for range queries
+    period_mask: Optional[int] = None  # selected_periods as bits, period 1 -> bit 0
+
+    @root_validator(skip_on_failure=True)
+    def fill_typed_fields(cls, values):
+        values.update(booking_typed_fields(values.get("date"), values.get("selected_periods")))
+        return values
 
     class Settings:
-        name = "Booking"
\ No newline at end of file
+        name = "Booking"
+        indexes = [
+            # booking_id is a random 7-digit string, so enforce uniqueness in the DB
+            IndexModel(
+                [("booking_id", ASCENDING)],
+                name="booking_id_unique",
+                unique=True,
+                partialFilterExpression={"booking_id": {"$type": "string"}},
+            ),
+            # create_booking_room, get_room_schedules, delete_room
+            IndexModel(
+                [("room_id", ASCENDING), ("date", ASCENDING), ("status", ASCENDING)],
+                name="room_date_status",
+            ),
+            # get_user_calendar
+            IndexModel(
+                [("email", ASCENDING), ("status", ASCENDING), ("date", DESCENDING)],
+                name="email_status_date",
+            ),
+            # delete_room and analytics rollups, ranges over the typed date
+            IndexModel([("booking_date", ASCENDING), ("room_id", ASCENDING)], name="booking_date_room"),
+            # booking_scheduler sweeps and archival
+            IndexModel([("status", ASCENDING), ("booking_date", ASCENDING)], name="status_booking_date"),
+            # get_user_bookings, paged on (date, booking_id)
+            IndexModel(
+                [("student_id", ASCENDING), ("date", DESCENDING), ("booking_id", DESCENDING)],
+                name="student_date_booking",
+            ),
+        ]
@@ -0,0 +1,30 @@
+from beanie import Document
+from datetime import datetime
+from pymongo import IndexModel, ASCENDING
+from typing import Any, Optional
+
+# How long a stored response is replayed for retries of the same key
+IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60
+# IN_PROGRESS records older than this were left by a crashed worker and can be taken over
+IDEMPOTENCY_LEASE_SECONDS = 60
+
+
+class IdempotencyState:
+    IN_PROGRESS = "IN_PROGRESS"
+    DONE = "DONE"
+
+
+class IdempotencyRecord(Document):
+    key: str
+    scope: str  # Endpoint and path parameters the key was used with
+    fingerprint: str  # Hash of the request arguments
+    state: str = IdempotencyState.IN_PROGRESS
+    response: Optional[Any] = None
+    created_at: datetime
+
+    class Settings:
+        name = "IdempotencyRecord"
+        indexes = [
+            IndexModel([("key", ASCENDING), ("scope", ASCENDING)], name="key_scope_unique", unique=True),
+            IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS),
+        ]
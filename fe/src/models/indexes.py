@@ -0,0 +1,101 @@
+import logging
+from typing import List, Type
+
+from beanie import Document
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+from models.booking import Booking
+from models.occupancy import RoomOccupancy, backfill_occupancy
+from models.idempotency import IdempotencyRecord
+from models.room_usage import RoomUsageDaily
+
+logger = logging.getLogger(__name__)
+
+# Equality-filter shapes used by the routers, per document
+QUERY_SHAPES = {
+    Booking: [
+        ["booking_id"],
+        ["room_id", "date", "status"],
+        ["room_id"],
+        ["email", "status"],
+        ["student_id"],
+        ["status", "booking_date"],
+    ],
+    RoomOccupancy: [
+        ["room_id", "date"],
+        ["date"],
+    ],
+    IdempotencyRecord: [
+        ["key", "scope"],
+    ],
+    RoomUsageDaily: [
+        ["date", "room_id"],
+    ],
+}
+
+
+def is_covered(shape: List[str], index_keys: List[List[str]]) -> bool:
+    """
+    A query shape is covered when some index starts with exactly its fields
+    (in any order, since they are all equality matches)
+    """
+    for keys in index_keys:
+        if len(keys) >= len(shape) and set(keys[:len(shape)]) == set(shape):
+            return True
+    return False
+
+
+async def find_duplicates(collection, index: IndexModel, limit: int = 20) -> List[dict]:
+    """
+    Key values held by more than one document, which keep a unique index from being built
+    """
+    spec = index.document
+    pipeline = []
+    if "partialFilterExpression" in spec:
+        pipeline.append({"$match": spec["partialFilterExpression"]})
+    pipeline += [
+        {"$group": {"_id": {field: f"${field}" for field in spec["key"]}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": limit},
+    ]
+    return [row["_id"] async for row in collection.aggregate(pipeline, allowDiskUse=True)]
+
+
+async def ensure_indexes(document: Type[Document]) -> List[List[str]]:
+    """
+    Create the indexes declared in document.Settings and return the
+    query shapes that are still not covered by any index
+    """
+    collection = document.get_motor_collection()
+    # One index at a time, so an index that cannot be built does not block the others
+    for index in getattr(document.Settings, "indexes", []):
+        try:
+            await collection.create_indexes([index])
+        except OperationFailure as e:
+            if e.code != 11000:
+                raise
+            logger.error(
+                "Cannot create unique index %s on %s, duplicate values: %s",
+                index.document["name"], document.Settings.name, await find_duplicates(collection, index),
+            )
+
+    index_info = await collection.index_information()
+    index_keys = [[field for field, _ in info["key"]] for info in index_info.values()]
+
+    missing = [shape for shape in QUERY_SHAPES.get(document, []) if not is_covered(shape, index_keys)]
+    for shape in missing:
+        logger.warning("No index covers %s query on %s", shape, document.Settings.name)
+    return missing
+
+
+async def init_indexes():
+    """
+    Startup routine: create indexes for every known document, log
+    query shapes without index coverage, then backfill the occupancy
+    masks (needs the unique room/date index to exist)
+    """
+    for document in QUERY_SHAPES:
+        await ensure_indexes(document)
+
+    touched = await backfill_occupancy()
+    logger.info("Occupancy backfilled for %d room/dates", touched)
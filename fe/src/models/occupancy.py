@@ -0,0 +1,267 @@
+from beanie import Document
+from datetime import datetime
+from pymongo import IndexModel, ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from typing import List, Optional, Tuple
+from const import BookingState, RoomState
+from models.booking import Booking, PERIODS_PER_DAY, periods_to_mask, stored_periods_mask, mask_to_periods
+from schedule_cache import schedule_cache
+from schedule_events import schedule_events
+
+FULL_MASK = (1 << PERIODS_PER_DAY) - 1
+
+# Collection recording one-off data fixes that already ran
+BACKFILL_MARKERS = "DataMigrations"
+
+
+class RoomOccupancy(Document):
+    """
+    Occupied periods of one room on one date
+    booked_mask holds PENDING bookings, in_use_mask holds IN_USE bookings
+    """
+    room_id: str
+    date: str
+    booked_mask: int = 0
+    in_use_mask: int = 0
+
+    @property
+    def occupied_mask(self) -> int:
+        return self.booked_mask | self.in_use_mask
+
+    class Settings:
+        name = "RoomOccupancy"
+        indexes = [
+            IndexModel(
+                [("room_id", ASCENDING), ("date", ASCENDING)],
+                name="room_date_unique",
+                unique=True,
+            ),
+            IndexModel([("date", ASCENDING)], name="date"),
+        ]
+
+
+# Which mask a booking contributes to for each status
+STATUS_FIELD = {
+    BookingState.PENDING: "booked_mask",
+    BookingState.IN_USE: "in_use_mask",
+}
+
+# Room state shown on the schedule for periods set in each mask
+FIELD_STATE = {
+    "booked_mask": RoomState.BOOKED,
+    "in_use_mask": RoomState.IN_USE,
+}
+
+
+async def get_occupied_mask(room_id: str, date: str) -> int:
+    occupancy = await RoomOccupancy.find_one({"room_id": room_id, "date": date})
+    return occupancy.occupied_mask if occupancy else 0
+
+
+async def apply_transition(
+    room_id: str,
+    date: str,
+    periods: Optional[List[int]],
+    old_status: Optional[str],
+    new_status: Optional[str],
+):
+    """
+    Move a booking's periods from the mask of old_status to the mask of new_status
+    Statuses without a mask (COMPLETED, CANCELLED, None) leave the periods free
+    """
+    mask = stored_periods_mask(periods)
+    old_field = STATUS_FIELD.get(old_status)
+    new_field = STATUS_FIELD.get(new_status)
+    if not mask or old_field == new_field:
+        return
+
+    bit = {}
+    if old_field:
+        bit[old_field] = {"and": FULL_MASK & ~mask}
+    if new_field:
+        bit[new_field] = {"or": mask}
+
+    await RoomOccupancy.get_motor_collection().update_one(
+        {"room_id": room_id, "date": date},
+        {"$bit": bit, "$setOnInsert": missing_masks(bit)},
+        upsert=True,
+    )
+    await schedule_cache.invalidate(date)
+    schedule_events.publish(room_id, date, mask_to_periods(mask), FIELD_STATE.get(new_field, RoomState.AVAILABLE))
+
+
+def missing_masks(bit: dict) -> dict:
+    """
+    Masks not touched by a $bit update, initialised on upsert so that
+    every occupancy document carries both fields ($bitsAllClear never
+    matches a missing field)
+    """
+    return {field: 0 for field in STATUS_FIELD.values() if field not in bit}
+
+
+def reserve_update(room_id: str, date: str, mask: int) -> Tuple[dict, dict]:
+    """
+    Filter and update of the conditional upsert marking periods as booked
+    if none of them is booked or in use
+
+    The filter only matches when all requested bits are clear. If the
+    document exists but conflicts, the upsert tries to insert a second
+    document for the same room and date and fails on the unique index,
+    so concurrent requests for the same periods cannot both succeed.
+
+    A duplicate key error can also mean a concurrent request created the
+    document first (for other periods), so callers retry once without
+    upsert and only report a conflict when that retry matches nothing.
+    """
+    bit = {"booked_mask": {"or": mask}}
+    return (
+        {
+            "room_id": room_id,
+            "date": date,
+            "booked_mask": {"$bitsAllClear": mask},
+            "in_use_mask": {"$bitsAllClear": mask},
+        },
+        {"$bit": bit, "$setOnInsert": missing_masks(bit)},
+    )
+
+
+async def reserve_periods(room_id: str, date: str, mask: int) -> bool:
+    """
+    Atomically mark periods as booked, returns False on conflict
+    """
+    query, update = reserve_update(room_id, date, mask)
+    collection = RoomOccupancy.get_motor_collection()
+    try:
+        await collection.update_one(query, update, upsert=True)
+    except DuplicateKeyError:
+        result = await collection.update_one(query, update)
+        if result.matched_count == 0:
+            return False
+    await schedule_cache.invalidate(date)
+    schedule_events.publish(room_id, date, mask_to_periods(mask), RoomState.BOOKED)
+    return True
+
+
+async def reserve_many(room_id: str, slots: List[Tuple[str, int]]) -> List[bool]:
+    """
+    Reserve several (date, mask) slots of one room in a single bulk write
+    Each slot succeeds or conflicts independently, returns one flag per slot
+    """
+    if not slots:
+        return []
+
+    collection = RoomOccupancy.get_motor_collection()
+    operations = [UpdateOne(*reserve_update(room_id, date, mask), upsert=True) for date, mask in slots]
+    reserved = [True] * len(slots)
+    try:
+        await collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != 11000 for error in errors):
+            # The batch is unordered, so every slot without an error was reserved: release them
+            failed = {error["index"] for error in errors}
+            for index, (date, mask) in enumerate(slots):
+                if index not in failed:
+                    await apply_transition(room_id, date, mask_to_periods(mask), BookingState.PENDING, None)
+            raise
+        for error in errors:
+            # Lost the insert race or a real conflict, retry without upsert to tell them apart
+            index = error["index"]
+            date, mask = slots[index]
+            result = await collection.update_one(*reserve_update(room_id, date, mask))
+            reserved[index] = result.matched_count > 0
+
+    for (date, mask), ok in zip(slots, reserved):
+        if ok:
+            await schedule_cache.invalidate(date)
+            schedule_events.publish(room_id, date, mask_to_periods(mask), RoomState.BOOKED)
+    return reserved
+
+
+async def active_masks(room_id: str, date: str) -> dict:
+    """
+    Masks of a room and date computed from its active bookings
+    """
+    masks = {"booked_mask": 0, "in_use_mask": 0}
+    cursor = Booking.get_motor_collection().find(
+        {"room_id": room_id, "date": date, "status": {"$in": list(STATUS_FIELD)}},
+        {"status": 1, "selected_periods": 1},
+    )
+    async for doc in cursor:
+        masks[STATUS_FIELD[doc["status"]]] |= stored_periods_mask(doc.get("selected_periods"))
+    return masks
+
+
+async def rebuild_occupancy(room_id: str, date: str) -> RoomOccupancy:
+    """
+    Recompute the masks for a room and date from the Booking collection
+    Used to repair drift, overwrites concurrent changes so only run it offline
+    """
+    masks = await active_masks(room_id, date)
+    await RoomOccupancy.get_motor_collection().update_one(
+        {"room_id": room_id, "date": date},
+        {"$set": masks},
+        upsert=True,
+    )
+    await schedule_cache.invalidate(date)
+    return RoomOccupancy(room_id=room_id, date=date, **masks)
+
+
+async def backfill_slot(room_id: str, date: str) -> bool:
+    """
+    OR the active bookings of one room and date into its masks, then take back
+    the bits a concurrent cancel/checkin/checkout released in the meantime
+    Bits we added are checked against a fresh read of the bookings: a bit that
+    is no longer held by an active booking was released while we wrote, and no
+    reservation can have claimed it since because it was set. Returns True if
+    any bit was added.
+    """
+    collection = RoomOccupancy.get_motor_collection()
+    masks = await active_masks(room_id, date)
+    if not any(masks.values()):
+        return False
+
+    before = await collection.find_one_and_update(
+        {"room_id": room_id, "date": date},
+        {"$bit": {field: {"or": mask} for field, mask in masks.items()}},
+        upsert=True,
+    ) or {}
+    added = {field: mask & ~(before.get(field) or 0) for field, mask in masks.items()}
+    if not any(added.values()):
+        return False
+
+    fresh = await active_masks(room_id, date)
+    stale = {field: mask & ~fresh[field] for field, mask in added.items() if mask & ~fresh[field]}
+    if stale:
+        await collection.update_one(
+            {"room_id": room_id, "date": date},
+            {"$bit": {field: {"and": FULL_MASK & ~mask} for field, mask in stale.items()}},
+        )
+    await schedule_cache.invalidate(date)
+    return True
+
+
+async def backfill_occupancy() -> int:
+    """
+    Bring the occupancy masks in line with bookings made before they existed
+    Runs on startup until it has completed once, then a marker skips it.
+    Each room/date is handled by backfill_slot, so it is safe while other
+    workers serve traffic. Returns the number of room/dates changed.
+    """
+    markers = RoomOccupancy.get_motor_collection().database[BACKFILL_MARKERS]
+    if await markers.find_one({"_id": "occupancy_backfill"}):
+        return 0
+
+    slots = Booking.get_motor_collection().aggregate([
+        {"$match": {"status": {"$in": list(STATUS_FIELD)}}},
+        {"$group": {"_id": {"room_id": "$room_id", "date": "$date"}}},
+    ])
+    changed = 0
+    async for slot in slots:
+        if await backfill_slot(slot["_id"].get("room_id"), slot["_id"].get("date")):
+            changed += 1
+
+    await markers.update_one(
+        {"_id": "occupancy_backfill"}, {"$set": {"done_at": datetime.utcnow(), "changed": changed}}, upsert=True
+    )
+    return changed
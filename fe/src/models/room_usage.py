@@ -0,0 +1,19 @@
+from beanie import Document
+from pymongo import IndexModel, ASCENDING
+from typing import Dict, List
+
+
+class RoomUsageDaily(Document):
+    """
+    Booked period counts of one room on one date, per status
+    counts[status][i] is the number of bookings in that status holding period i + 1
+    """
+    room_id: str
+    date: str
+    counts: Dict[str, List[int]]
+
+    class Settings:
+        name = "RoomUsageDaily"
+        indexes = [
+            IndexModel([("date", ASCENDING), ("room_id", ASCENDING)], name="date_room_unique", unique=True),
+        ]
@@ -0,0 +1,75 @@
+import base64
+import json
+from typing import List, Optional
+from fastapi import HTTPException, Response
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Response header carrying the cursor of the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: List[Optional[str]]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Optional[str]]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def build_page_query(
+    query: dict,
+    sort_fields: List[str],
+    cursor: Optional[str] = None,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+) -> dict:
+    """
+    Add the date range and keyset conditions to a query
+    Pages are sorted descending on sort_fields, the cursor holds the
+    sort key of the last item of the previous page
+    """
+    conditions = [query]
+
+    date_range = {}
+    if from_date:
+        date_range["$gte"] = from_date
+    if to_date:
+        date_range["$lte"] = to_date
+    if date_range:
+        conditions.append({"date": date_range})
+
+    if cursor:
+        values = decode_cursor(cursor, len(sort_fields))
+        # (a, b) < (x, y)  <=>  a < x  or  (a == x and b < y)
+        keyset = []
+        for i, field in enumerate(sort_fields):
+            condition = {sort_fields[j]: values[j] for j in range(i)}
+            condition[field] = {"$lt": values[i]}
+            keyset.append(condition)
+        conditions.append({"$or": keyset})
+
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def set_cursor_header(response: Response, values: List[Optional[str]]):
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(values)
+    # Cross-origin clients can only read the header when it is exposed
+    response.headers["Access-Control-Expose-Headers"] = NEXT_CURSOR_HEADER
+
+
+def set_next_cursor(response: Response, items: list, sort_fields: List[str], limit: int):
+    """
+    Expose the cursor of the next page when the current page is full
+    """
+    if len(items) < limit:
+        return
+    last = items[-1]
+    set_cursor_header(response, [getattr(last, field) for field in sort_fields])
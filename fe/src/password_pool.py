@@ -0,0 +1,77 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from utils import hash_password, verify_password
+from metrics import register_collector
+
+# Threads running bcrypt (it releases the GIL while hashing)
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", "4"))
+# Hash/verify calls allowed to wait for a worker before answering 429
+PASSWORD_POOL_MAX_PENDING = int(os.getenv("PASSWORD_POOL_MAX_PENDING", "64"))
+# bcrypt cost factor for new hashes, unset keeps utils.hash_password's default
+PASSWORD_HASH_ROUNDS = os.getenv("PASSWORD_HASH_ROUNDS")
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_POOL_WORKERS, thread_name_prefix="password")
+_in_flight = 0
+
+password_metrics = {
+    op: {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0, "rejected": 0}
+    for op in ("hash", "verify")
+}
+
+
+def _hash(password: str) -> str:
+    if PASSWORD_HASH_ROUNDS:
+        import bcrypt
+        salt = bcrypt.gensalt(rounds=int(PASSWORD_HASH_ROUNDS))
+        return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
+    return hash_password(password)
+
+
+async def _run(op: str, func, *args):
+    """
+    Run func in the password pool, rejecting with 429 when the pool is saturated
+    """
+    global _in_flight
+    metrics = password_metrics[op]
+    if _in_flight >= PASSWORD_POOL_WORKERS + PASSWORD_POOL_MAX_PENDING:
+        metrics["rejected"] += 1
+        raise HTTPException(status_code=429, detail="Too many sign-in requests, please try again shortly")
+
+    _in_flight += 1
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    finally:
+        _in_flight -= 1
+        elapsed = time.perf_counter() - started
+        metrics["calls"] += 1
+        metrics["total_seconds"] += elapsed
+        metrics["max_seconds"] = max(metrics["max_seconds"], elapsed)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run("hash", _hash, password)
+
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await _run("verify", verify_password, password, hashed)
+
+
+def password_metric_families():
+    ops = sorted(password_metrics.items())
+    yield ("password_calls_total", "counter", "Password hash/verify calls run in the pool",
+           [({"op": op}, m["calls"]) for op, m in ops])
+    yield ("password_seconds_total", "counter", "Time spent in password hash/verify calls, queueing included",
+           [({"op": op}, m["total_seconds"]) for op, m in ops])
+    yield ("password_max_seconds", "gauge", "Slowest password hash/verify call",
+           [({"op": op}, m["max_seconds"]) for op, m in ops])
+    yield ("password_rejected_total", "counter", "Password calls rejected with 429 because the pool was saturated",
+           [({"op": op}, m["rejected"]) for op, m in ops])
+    yield ("password_pool_in_flight", "gauge", "Password calls running or waiting for a worker",
+           [({}, _in_flight)])
+
+
+register_collector(password_metric_families)
@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta
+from typing import Dict, List
+import numpy as np
+from pymongo import ReplaceOne
+from const import BookingState
+from models.booking import Booking, PERIODS_PER_DAY, DATE_FORMAT, parse_booking_date
+from models.room_usage import RoomUsageDaily
+from booking_archive import archive_collections
+
+# Pseudo status for bookings the scheduler cancelled because nobody checked in
+NO_SHOW = "NO_SHOW"
+ROLLUP_STATUSES = [BookingState.PENDING, BookingState.IN_USE, BookingState.COMPLETED, BookingState.CANCELLED, NO_SHOW]
+# Statuses that count as the room being used (or about to be)
+OCCUPIED_STATUSES = [BookingState.PENDING, BookingState.IN_USE, BookingState.COMPLETED]
+
+
+def date_range(from_date: str, to_date: str) -> List[str]:
+    start = datetime.strptime(from_date, DATE_FORMAT)
+    end = datetime.strptime(to_date, DATE_FORMAT)
+    return [(start + timedelta(days=i)).strftime(DATE_FORMAT) for i in range((end - start).days + 1)]
+
+
+async def rollup_days(dates: List[str]) -> int:
+    """
+    Recompute the rollups of the given dates with one aggregation per source:
+    the Booking collection plus the archive terms the dates reach into, so
+    history can still be rolled up after it has been archived
+    A booking caught by an archival run between its copy and its delete can be
+    counted twice; the nightly rollup runs before archival so it never is.
+    """
+    if not dates:
+        return 0
+
+    group = [
+        {"$unwind": "$selected_periods"},
+        {"$match": {"selected_periods": {"$gte": 1, "$lte": PERIODS_PER_DAY}}},
+        {"$group": {
+            "_id": {
+                "room_id": "$room_id",
+                "date": "$date",
+                "status": {"$cond": [{"$eq": ["$no_show", True]}, NO_SHOW, "$status"]},
+                "period": "$selected_periods",
+            },
+            "count": {"$sum": 1},
+        }},
+    ]
+    sources = [(
+        Booking.get_motor_collection(),
+        # booking_date_room serves the typed match, documents not migrated yet match on the string
+        {"$or": [
+            {"booking_date": {"$in": [parse_booking_date(date) for date in dates]}},
+            {"booking_date": None, "date": {"$in": dates}},
+        ]},
+    )]
+    # Archive terms are indexed on the date string
+    sources += [
+        (archive, {"date": {"$in": dates}})
+        for archive in await archive_collections(min(dates), max(dates))
+    ]
+
+    rollups: Dict[tuple, Dict[str, List[int]]] = {}
+    for source, match in sources:
+        async for row in source.aggregate([{"$match": match}] + group):
+            key = row["_id"]
+            if key["status"] not in ROLLUP_STATUSES:
+                continue
+            counts = rollups.setdefault((key["room_id"], key["date"]), {
+                status: [0] * PERIODS_PER_DAY for status in ROLLUP_STATUSES
+            })
+            counts[key["status"]][key["period"] - 1] += row["count"]
+
+    # Replace each rollup in place so a concurrent reader or rollup never sees a day missing
+    collection = RoomUsageDaily.get_motor_collection()
+    if rollups:
+        await collection.bulk_write([
+            ReplaceOne(
+                {"date": date, "room_id": room_id},
+                {"room_id": room_id, "date": date, "counts": counts},
+                upsert=True,
+            )
+            for (room_id, date), counts in rollups.items()
+        ], ordered=False)
+
+    # Drop rollups of rooms that no longer have bookings on those dates
+    for date in dates:
+        room_ids = [room_id for room_id, rollup_date in rollups if rollup_date == date]
+        await collection.delete_many({"date": date, "room_id": {"$nin": room_ids}})
+    return len(rollups)
+
+
+async def utilization(from_date: str, to_date: str, room_ids: List[str]) -> dict:
+    """
+    Heatmap, occupancy rate and no-show rate per room and period over a date range
+    Rollups are summed into a (rooms, statuses, periods) array, so the cost
+    grows with the number of rollup documents, not bookings.
+    """
+    room_index = {room_id: i for i, room_id in enumerate(room_ids)}
+    totals = np.zeros((len(room_ids), len(ROLLUP_STATUSES), PERIODS_PER_DAY), dtype=np.int64)
+
+    query = {"date": {"$gte": from_date, "$lte": to_date}, "room_id": {"$in": room_ids}}
+    async for doc in RoomUsageDaily.get_motor_collection().find(query, {"_id": 0, "room_id": 1, "counts": 1}):
+        counts = doc["counts"]
+        totals[room_index[doc["room_id"]]] += np.array(
+            [counts.get(status, [0] * PERIODS_PER_DAY) for status in ROLLUP_STATUSES], dtype=np.int64
+        )
+
+    status_index = {status: i for i, status in enumerate(ROLLUP_STATUSES)}
+    occupied = totals[:, [status_index[s] for s in OCCUPIED_STATUSES], :].sum(axis=1)
+    no_shows = totals[:, status_index[NO_SHOW], :]
+    # Bookings whose time came: checked in (IN_USE/COMPLETED) or no-show
+    attended = totals[:, status_index[BookingState.IN_USE], :] + totals[:, status_index[BookingState.COMPLETED], :]
+
+    days = len(date_range(from_date, to_date))
+    slots = max(days, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        no_show_rate = np.where(attended + no_shows > 0, no_shows / (attended + no_shows), 0.0)
+        room_no_show_rate = np.where(
+            attended.sum(axis=1) + no_shows.sum(axis=1) > 0,
+            no_shows.sum(axis=1) / (attended.sum(axis=1) + no_shows.sum(axis=1)),
+            0.0,
+        )
+
+    return {
+        "from": from_date,
+        "to": to_date,
+        "days": days,
+        "room_ids": room_ids,
+        "periods": list(range(1, PERIODS_PER_DAY + 1)),
+        # Occupied bookings per room (rows) and period (columns)
+        "heatmap": occupied.tolist(),
+        "occupancy_rate": {
+            "by_room_period": (occupied / slots).round(4).tolist(),
+            "by_room": dict(zip(room_ids, (occupied.sum(axis=1) / (slots * PERIODS_PER_DAY)).round(4).tolist())),
+            "by_period": (occupied.sum(axis=0) / (slots * max(len(room_ids), 1))).round(4).tolist(),
+        },
+        "no_show_rate": {
+            "by_room_period": no_show_rate.round(4).tolist(),
+            "by_room": dict(zip(room_ids, room_no_show_rate.round(4).tolist())),
+        },
+        "status_totals": {
+            status: int(totals[:, i, :].sum()) for i, status in enumerate(ROLLUP_STATUSES)
+        },
+    }
@@ -0,0 +1,132 @@
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from models.room import Room
+from metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached room is trusted before it is read again
+ROOM_CACHE_TTL = float(os.getenv("ROOM_CACHE_TTL", "30"))
+
+
+class RoomCache:
+    """
+    Read-through, in-process cache of the Room catalog keyed by room_id
+    Rooms change through create_room, update_room and delete_room, which
+    call invalidate() on the worker that served them. Entries expire after
+    ROOM_CACHE_TTL seconds so other workers pick up changes too, and
+    watch_room_changes() (replica sets only) drops them right away.
+    Misses are never cached: an unknown room_id is looked up again.
+    """
+
+    def __init__(self, ttl: float = ROOM_CACHE_TTL):
+        self.ttl = ttl
+        # room_id -> (expires_at, room)
+        self._rooms: Dict[str, Tuple[float, Room]] = {}
+        # Until when the whole collection is known to be loaded, for list_all
+        self._complete_until = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, room_id: str) -> Optional[Room]:
+        entry = self._rooms.get(room_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def _store(self, room: Room):
+        self._rooms[room.room_id] = (time.monotonic() + self.ttl, room)
+
+    async def get(self, room_id: str) -> Optional[Room]:
+        room = self._fresh(room_id)
+        if room is not None:
+            self.hits += 1
+            return room
+
+        self.misses += 1
+        room = await Room.find_one(Room.room_id == room_id)
+        if room:
+            self._store(room)
+        else:
+            self._rooms.pop(room_id, None)
+        return room
+
+    async def get_many(self, room_ids: Iterable[str]) -> Dict[str, Room]:
+        rooms = {}
+        missing = []
+        for room_id in set(room_ids):
+            room = self._fresh(room_id)
+            if room is not None:
+                rooms[room_id] = room
+            else:
+                missing.append(room_id)
+        self.hits += len(rooms)
+
+        if missing:
+            self.misses += len(missing)
+            for room in await Room.find({"room_id": {"$in": missing}}).to_list():
+                self._store(room)
+                rooms[room.room_id] = room
+        return rooms
+
+    async def list_all(self) -> List[Room]:
+        now = time.monotonic()
+        if self._complete_until >= now:
+            self.hits += 1
+            return [room for expires_at, room in self._rooms.values() if expires_at >= now]
+
+        self.misses += 1
+        rooms = await Room.find_all().to_list()
+        self._rooms = {}
+        for room in rooms:
+            self._store(room)
+        self._complete_until = now + self.ttl
+        return rooms
+
+    def invalidate(self, room_id: Optional[str] = None):
+        """
+        Drop one room (or every room when room_id is None) from the cache
+        """
+        if room_id is None:
+            self._rooms.clear()
+        else:
+            self._rooms.pop(room_id, None)
+        self._complete_until = 0.0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._rooms),
+            "complete": self._complete_until >= time.monotonic(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+room_cache = RoomCache()
+
+
+def room_cache_metric_families():
+    stats = room_cache.stats()
+    yield ("room_cache_size", "gauge", "Rooms held by the room catalog cache", [({}, stats["size"])])
+    yield ("room_cache_hits_total", "counter", "Room catalog cache hits", [({}, stats["hits"])])
+    yield ("room_cache_misses_total", "counter", "Room catalog cache misses", [({}, stats["misses"])])
+
+
+register_collector(room_cache_metric_families)
+
+
+async def watch_room_changes(cache: RoomCache = room_cache):
+    """
+    Invalidate the cache on every change to the Room collection
+    Requires MongoDB running as a replica set; start as a background task on startup
+    """
+    async with Room.get_motor_collection().watch() as stream:
+        async for change in stream:
+            room_id = (change.get("fullDocument") or {}).get("room_id")
+            # Deletes and partial updates don't carry room_id, drop everything then
+            cache.invalidate(room_id)
+            logger.debug("Room cache invalidated by %s", change.get("operationType"))
@@ -1,10 +1,13 @@
 import random
-from fastapi import APIRouter, Header, HTTPException, status, Depends
+from fastapi import APIRouter, Header, HTTPException, status, Depends, Query, Response
 from models.user import CreateUserRequest
 from models.user import User
-from utils import hash_password, verify_password, create_access_token
-from ..deps import admin_required
-from typing import List
+from utils import create_access_token
+from password_pool import hash_password_async, verify_password_async
+from admin_cache import admin_required, admin_cache
+from typing import List, Optional
+from beanie import PydanticObjectId
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, set_cursor_header
 
 
 router = APIRouter(prefix="/auth")
@@ -25,7 +28,7 @@ async def create_admin_user(
             user_name=create_admin_user.user_name,
             email=create_admin_user.email,
             phone_number=create_admin_user.phone_number,
-            password=hash_password(create_admin_user.password),
+            password=await hash_password_async(create_admin_user.password),
             role="admin",
         )
         await new_user.insert()
@@ -42,7 +45,7 @@ async def signin_admin_user(
 ):
     try:
         user = await User.find_one(User.email == email)
-        if not user or not verify_password(password, user.password):
+        if not user or not await verify_password_async(password, user.password):
             raise HTTPException(status_code=401, detail="User name or password is incorrect!")
 
         token = create_access_token(data={"sub": user.user_id, "role": user.role})
@@ -60,7 +63,7 @@ async def signin_student_user(
 ):
     try:
         user = await User.find_one(User.email == email)
-        if not user or not verify_password(password, user.password):
+        if not user or not await verify_password_async(password, user.password):
             raise HTTPException(status_code=401, detail="User name or password is incorrect!")
 
         token = create_access_token(data={"sub": user.user_id, "role": user.role})
@@ -84,7 +87,7 @@ async def create_student_user(
             user_name=create_student_user.user_name,
             email=create_student_user.email,
             phone_number=create_student_user.phone_number,
-            password=hash_password(create_student_user.password),
+            password=await hash_password_async(create_student_user.password),
             role="student",  # khác admin chỗ này
         )
         await new_user.insert()
@@ -97,11 +100,26 @@ async def create_student_user(
     response_model=List[User]
 )
 async def get_all_users(
+     response: Response,
+     limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+     cursor: Optional[str] = None,
      user: dict = Depends(admin_required)
 ):
     try:
-        users = await User.find_all().to_list()
+        # Pages follow _id (creation order), which is always indexed
+        query = {}
+        if cursor:
+            try:
+                query["_id"] = {"$gt": PydanticObjectId(decode_cursor(cursor, 1)[0])}
+            except Exception:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        users = await User.find(query).sort([("_id", 1)]).limit(limit).to_list()
+        if len(users) == limit:
+            set_cursor_header(response, [str(users[-1].id)])
         return users
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -124,6 +142,8 @@ async def delete_user(
 
         # Delete user
         await user_to_delete.delete()
+        # Drop cached admin principals in case the deleted user was one
+        admin_cache.revoke()
         return {"message": "User deleted successfully"}
     except HTTPException:
         raise
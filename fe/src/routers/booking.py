@@ -1,17 +1,41 @@
-from fastapi import APIRouter, HTTPException, Header
-from models.booking import CreateBookingRequest, UpdateBookingRequest, Booking
-from models.room import Room
+from fastapi import APIRouter, HTTPException, Header, Response, Query, Depends
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from models.booking import CreateBookingRequest, UpdateBookingRequest, Booking, BookingSummary
+from models.booking import BulkBookingRequest, BulkBookingResult, BookingSlot, MAX_BULK_SLOTS, booking_typed_fields
+from room_cache import room_cache
+from booking_archive import with_archived, archive_collections, stream_archived, merge_sorted
+from idempotency import run_idempotent, request_fingerprint
+from concurrency import get_revision, revision_filter, revision_etag, check_if_match, raise_modified
 from models.user import User
+from models.occupancy import RoomOccupancy, periods_to_mask, stored_periods_mask, mask_to_periods, apply_transition, reserve_periods, reserve_many
 from const import RoomState, BookingState
-from typing import List, Dict, Tuple
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, build_page_query, set_next_cursor
+from typing import List, Dict, Tuple, Optional, AsyncIterator
 import random
 from datetime import datetime, timedelta
 import random
 import qrcode
-import base64
+import hashlib
 import json
+from functools import lru_cache
 from io import BytesIO
 import pytz
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+import csv
+from io import StringIO
+from admin_cache import admin_required
+
+# Attempts to draw a free random booking_id before giving up
+BOOKING_ID_ATTEMPTS = 5
+
+# Keyset order of booking list pages (descending)
+BOOKING_SORT_FIELDS = ["date", "booking_id"]
+BOOKING_SORT = [("date", -1), ("booking_id", -1)]
+
+# Rendered QR images kept in memory
+QR_CACHE_SIZE = 1024
 
 def get_period_time_range(period: int) -> Tuple[int, int]:
     """
@@ -61,6 +85,169 @@ def is_valid_booking_time(date: str, periods: List[int]) -> bool:
     except:
         return False
 
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def render_qr_png(qr_data: str) -> bytes:
+    """
+    Render QR data to PNG bytes
+    CPU bound, call it through run_in_threadpool from async handlers
+    """
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+
+    buffered = BytesIO()
+    img.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+def get_qr_data(booking_id: str, email: str) -> str:
+    # QR data format: "booking_id|email"
+    return f"{booking_id}|{email}"
+
+def export_csv_row(values: list) -> str:
+    buffer = StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+async def stream_bookings_export(
+    query: dict,
+    export_format: str,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Yield bookings matching query one line at a time, straight from the DB cursors
+    of the hot collection and of the archive terms the date range reaches
+    """
+    fields = list(BookingSummary.__fields__)
+    if export_format == "csv":
+        yield export_csv_row(fields)
+
+    streams = [Booking.find(query).sort(BOOKING_SORT).project(BookingSummary).__aiter__()]
+    streams += [
+        stream_archived(collection, query, BOOKING_SORT)
+        for collection in await archive_collections(from_date, to_date)
+    ]
+    async for booking in merge_sorted(streams, BOOKING_SORT):
+        if export_format == "csv":
+            row = [getattr(booking, field) for field in fields]
+            row[fields.index("selected_periods")] = " ".join(str(p) for p in booking.selected_periods or [])
+            yield export_csv_row(row)
+        else:
+            yield booking.json() + "\n"
+
+def expand_bulk_slots(request: BulkBookingRequest) -> List[BookingSlot]:
+    """
+    Explicit slots plus the occurrences of the recurrence rule
+    """
+    slots = list(request.slots or [])
+    rule = request.recurrence
+    if rule:
+        start = datetime.strptime(rule.start_date, "%Y-%m-%d")
+        for i in range(rule.count):
+            date = start + timedelta(weeks=i * rule.interval_weeks)
+            slots.append(BookingSlot(date=date.strftime("%Y-%m-%d"), selected_periods=rule.selected_periods))
+    return slots
+
+async def insert_new_bookings(bookings: List[Booking]) -> List[bool]:
+    """
+    Insert bookings in one batch, redrawing booking_id for the rare collisions
+    Returns one flag per booking
+    """
+    inserted = [False] * len(bookings)
+    pending = list(range(len(bookings)))
+    for _ in range(BOOKING_ID_ATTEMPTS):
+        if not pending:
+            break
+        for i in pending:
+            bookings[i].booking_id = str(random.randint(1000000, 9999999))
+
+        failed = set()
+        try:
+            await Booking.insert_many([bookings[i] for i in pending], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") != 11000:
+                    raise
+                failed.add(pending[error["index"]])
+
+        for i in pending:
+            inserted[i] = i not in failed
+        pending = sorted(failed)
+    return inserted
+
+async def transition_booking_status(
+    booking_id: str,
+    status_filter,
+    new_status: str,
+    email: Optional[str] = None,
+    extra_filter: Optional[dict] = None,
+) -> Optional[Tuple[Booking, str]]:
+    """
+    Atomically move a booking to new_status if it matches the expected status (and email)
+    Returns the updated booking and its previous status, or None if nothing matched
+    """
+    query = {"booking_id": booking_id, "status": status_filter}
+    if email is not None:
+        query["email"] = email
+    query.update(extra_filter or {})
+
+    doc = await Booking.get_motor_collection().find_one_and_update(
+        query,
+        {"$set": {"status": new_status}, "$inc": {"revision": 1}},
+        projection={"qr_code": 0},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if doc is None:
+        return None
+
+    booking = Booking.parse_obj(doc)
+    old_status = booking.status
+    booking.status = new_status
+    booking.revision = (booking.revision or 0) + 1
+    await apply_transition(booking.room_id, booking.date, booking.selected_periods, old_status, new_status)
+    return booking, old_status
+
+async def get_user_booking(booking_id: str, email: Optional[str]) -> Booking:
+    """
+    Booking lookup used to explain why a guarded transition did not apply
+    """
+    booking = await Booking.find_one(Booking.booking_id == booking_id)
+    if not booking:
+        raise HTTPException(status_code=404, detail="Booking not found")
+
+    # Verify user
+    if email is not None and booking.email != email:
+        raise HTTPException(status_code=403, detail="This booking belongs to another user")
+    return booking
+
+async def checkin_pending_booking(booking_id: str, email: str) -> Booking:
+    # Check-in is only allowed on the booking date during valid periods
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    current_period = get_current_period()
+
+    if current_period != 0:
+        result = await transition_booking_status(
+            booking_id, BookingState.PENDING, BookingState.IN_USE, email, {"date": current_date}
+        )
+        if result:
+            return result[0]
+
+    booking = await get_user_booking(booking_id, email)
+
+    # Check if booking is pending
+    if booking.status != BookingState.PENDING:
+        raise HTTPException(status_code=400, detail="Booking is not in pending state")
+
+    if current_date != booking.date:
+        raise HTTPException(status_code=400, detail="Can only check in on the booking date")
+
+    if current_period == 0:
+        raise HTTPException(status_code=400, detail="Check-in is only available during valid periods (6AM-6PM)")
+
+    # The booking changed between the update and the lookup
+    raise HTTPException(status_code=409, detail="Booking was modified concurrently, please retry")
+
 def get_current_period() -> int:
     """
     Get current period number based on current time
@@ -82,6 +269,19 @@ router = APIRouter(prefix="/booking")
 async def create_booking_room(
     room_id: str,
     create_booking_request: CreateBookingRequest,
+    idempotency_key: Optional[str] = Header(None),
+):
+    return await run_idempotent(
+        idempotency_key,
+        f"create_booking_room:{room_id}",
+        request_fingerprint(room_id, create_booking_request),
+        lambda: do_create_booking_room(room_id, create_booking_request),
+    )
+
+
+async def do_create_booking_room(
+    room_id: str,
+    create_booking_request: CreateBookingRequest,
 ):
     try:
         # Validate booking time
@@ -92,57 +292,52 @@ async def create_booking_room(
             )
 
         # Get room and check if it's available
-        room = await Room.find_one(Room.room_id == room_id)
+        room = await room_cache.get(room_id)
         if not room:
             raise HTTPException(status_code=404, detail="Room not found")
 
         if room.room_state != RoomState.AVAILABLE:
             raise HTTPException(status_code=400, detail="Room is not available for booking")
 
-        # Check if room is already booked for the requested date and periods
-        existing_bookings = await Booking.find({
-            "room_id": room_id,
-            "date": create_booking_request.date,
-            "status": {"$in": [BookingState.PENDING, BookingState.IN_USE]}
-        }).to_list()
-
-        # Check for period conflicts
-        requested_periods = set(create_booking_request.selected_periods)
-        for booking in existing_bookings:
-            existing_periods = set(booking.selected_periods)
-            if requested_periods & existing_periods:  # If there's any overlap
-                status_text = "in use" if booking.status == BookingState.IN_USE else "booked"
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Room is already {status_text} for some of the booked/in_use"
-                )
+        # Validate requested periods
+        try:
+            requested_mask = periods_to_mask(create_booking_request.selected_periods)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # Reserve the periods atomically before writing the booking
+        if not await reserve_periods(room_id, create_booking_request.date, requested_mask):
+            occupancy = await RoomOccupancy.find_one({"room_id": room_id, "date": create_booking_request.date})
+            in_use = occupancy is not None and occupancy.in_use_mask & requested_mask
+            status_text = "in use" if in_use else "booked"
+            raise HTTPException(
+                status_code=400,
+                detail=f"Room is already {status_text} for some of the booked/in_use"
+            )
 
         # Create new booking
         booking_data = create_booking_request.dict()
         booking_data["room_id"] = room_id  # Override room_id from path parameter
         
-        booking = Booking(
-            **booking_data,
-            booking_id=str(random.randint(1000000, 9999999)),
-            status=BookingState.PENDING,
-        )
-        await booking.save()
-
-        # Generate QR code
-        qr_data = f"{booking.booking_id}|{booking.email}"
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert QR code to base64
-        buffered = BytesIO()
-        img.save(buffered, format="PNG")
-        qr_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-        
-        # Add QR code to booking
-        booking.qr_code = qr_base64
-        await booking.save()
+        # booking_id has a unique index, so retry on the rare collision
+        try:
+            for _ in range(BOOKING_ID_ATTEMPTS):
+                booking = Booking(
+                    **booking_data,
+                    booking_id=str(random.randint(1000000, 9999999)),
+                    status=BookingState.PENDING,
+                )
+                try:
+                    await booking.insert()
+                    break
+                except DuplicateKeyError:
+                    continue
+            else:
+                raise HTTPException(status_code=500, detail="Could not allocate a booking ID")
+        except Exception:
+            # Release the reserved periods if the booking could not be written
+            await apply_transition(room_id, create_booking_request.date, create_booking_request.selected_periods, BookingState.PENDING, None)
+            raise
 
         return booking
     except HTTPException:
@@ -151,6 +346,89 @@ async def create_booking_room(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post(
+    "/bulk/{room_id}",
+    response_model=List[BulkBookingResult]
+)
+async def create_bulk_booking_room(
+    room_id: str,
+    bulk_booking_request: BulkBookingRequest,
+):
+    try:
+        slots = expand_bulk_slots(bulk_booking_request)
+        if not slots:
+            raise HTTPException(status_code=400, detail="No dates to book")
+        if len(slots) > MAX_BULK_SLOTS:
+            raise HTTPException(status_code=400, detail=f"Cannot book more than {MAX_BULK_SLOTS} dates at once")
+
+        # Get room and check if it's available
+        room = await room_cache.get(room_id)
+        if not room:
+            raise HTTPException(status_code=404, detail="Room not found")
+
+        if room.room_state != RoomState.AVAILABLE:
+            raise HTTPException(status_code=400, detail="Room is not available for booking")
+
+        results = [
+            BulkBookingResult(date=slot.date, selected_periods=slot.selected_periods, success=False)
+            for slot in slots
+        ]
+
+        # Validate every slot before touching the database
+        valid = []
+        for i, slot in enumerate(slots):
+            if not is_valid_booking_time(slot.date, slot.selected_periods):
+                results[i].detail = "Invalid booking time"
+                continue
+            try:
+                valid.append((i, slot.date, periods_to_mask(slot.selected_periods)))
+            except ValueError as e:
+                results[i].detail = str(e)
+
+        # Reserve all valid slots in one bulk write
+        reserved = await reserve_many(room_id, [(date, mask) for _, date, mask in valid])
+        reserved_slots = []
+        for (i, _, _), ok in zip(valid, reserved):
+            if ok:
+                reserved_slots.append(i)
+            else:
+                results[i].detail = "Room is already booked or in use for some of the periods"
+
+        # Insert all reserved bookings in one batch
+        booking_data = bulk_booking_request.dict(exclude={"slots", "recurrence"})
+        bookings = [
+            Booking(
+                **booking_data,
+                room_id=room_id,
+                date=slots[i].date,
+                selected_periods=slots[i].selected_periods,
+                status=BookingState.PENDING,
+            )
+            for i in reserved_slots
+        ]
+        try:
+            inserted = await insert_new_bookings(bookings)
+        except Exception:
+            # Release the reserved periods if the bookings could not be written
+            for booking in bookings:
+                await apply_transition(room_id, booking.date, booking.selected_periods, BookingState.PENDING, None)
+            raise
+
+        for i, booking, ok in zip(reserved_slots, bookings, inserted):
+            if ok:
+                results[i].success = True
+                results[i].booking_id = booking.booking_id
+            else:
+                results[i].detail = "Could not allocate a booking ID"
+                await apply_transition(room_id, booking.date, booking.selected_periods, BookingState.PENDING, None)
+
+        return results
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.put(
     "/{booking_id}",
     response_model=Booking
@@ -158,19 +436,113 @@ async def create_booking_room(
 async def update_booking_room(
     booking_id: str,
     update_booking_request: UpdateBookingRequest,
+    response: Response,
+    if_match: Optional[str] = Header(None),
 ):
     try:
         # Get booking by ID
-        booking = await Booking.find_one(Booking.booking_id == booking_id)
-        if not booking:
+        current = await Booking.get_motor_collection().find_one(
+            {"booking_id": booking_id}, projection={"qr_code": 0}
+        )
+        if not current:
             raise HTTPException(status_code=404, detail="Booking not found")
 
-        # Update booking with new data
+        revision = get_revision(current)
+        check_if_match(if_match, revision)
+
         update_data = update_booking_request.dict(exclude_unset=True)
-        for key, value in update_data.items():
-            setattr(booking, key, value)
+        if not update_data:
+            response.headers["ETag"] = revision_etag(revision)
+            return Booking.parse_obj(current)
 
-        await booking.save()
+        old_status = current.get("status")
+        new_status = update_data.get("status", old_status)
+        old_slot = (current.get("room_id"), current.get("date"))
+        new_slot = (update_data.get("room_id", old_slot[0]), update_data.get("date", old_slot[1]))
+
+        try:
+            old_mask = stored_periods_mask(current.get("selected_periods"))
+            new_mask = periods_to_mask(update_data.get("selected_periods", current.get("selected_periods") or []))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # Keep the typed fields in sync with the date and periods
+        if "date" in update_data or "selected_periods" in update_data:
+            update_data.update(booking_typed_fields(
+                new_slot[1], update_data.get("selected_periods", current.get("selected_periods"))
+            ))
+
+        active = (BookingState.PENDING, BookingState.IN_USE)
+        rescheduled = (old_slot, old_mask) != (new_slot, new_mask)
+        if rescheduled and not (old_status == BookingState.PENDING and new_status == BookingState.PENDING):
+            raise HTTPException(status_code=400, detail="Only pending bookings can be rescheduled")
+
+        # Reserve the periods the booking does not hold yet, same conflict check as creation
+        reserved_mask = 0
+        if new_status in active:
+            if rescheduled:
+                reserved_mask = new_mask & ~(old_mask if new_slot == old_slot else 0)
+            elif old_status not in active:
+                reserved_mask = new_mask
+
+        # A moved or reactivated booking must pass the same checks as a new one
+        # (an admin setting IN_USE directly is checking it in, its period has started)
+        if rescheduled or reserved_mask:
+            new_periods = mask_to_periods(new_mask)
+            if new_status == BookingState.PENDING and not is_valid_booking_time(new_slot[1], new_periods):
+                raise HTTPException(
+                    status_code=400,
+                    detail="Invalid booking time. Cannot book past periods or periods starting in less than 15 minutes"
+                )
+
+            room = await room_cache.get(new_slot[0])
+            if not room:
+                raise HTTPException(status_code=404, detail="Room not found")
+
+            if room.room_state != RoomState.AVAILABLE:
+                raise HTTPException(status_code=400, detail="Room is not available for booking")
+
+        if reserved_mask and not await reserve_periods(new_slot[0], new_slot[1], reserved_mask):
+            raise HTTPException(status_code=400, detail="Room is already booked or in use for some of the periods")
+
+        async def release_reserved():
+            if reserved_mask:
+                await apply_transition(new_slot[0], new_slot[1], mask_to_periods(reserved_mask), BookingState.PENDING, None)
+
+        # Only the changed fields are written, guarded on the revision, status and slot
+        # that were read, the occupancy changes below are only valid for that state
+        try:
+            updated = await Booking.get_motor_collection().find_one_and_update(
+                {
+                    "booking_id": booking_id,
+                    "revision": revision_filter(revision),
+                    "status": old_status,
+                    "room_id": old_slot[0],
+                    "date": old_slot[1],
+                    "selected_periods": current.get("selected_periods"),
+                },
+                {"$set": update_data, "$inc": {"revision": 1}},
+                projection={"qr_code": 0},
+                return_document=ReturnDocument.AFTER,
+            )
+        except Exception:
+            await release_reserved()
+            raise
+        if updated is None:
+            await release_reserved()
+            raise_modified(if_match)
+
+        # Bring the occupancy masks in line with the new slot and status
+        if rescheduled:
+            released_mask = old_mask & ~(new_mask if new_slot == old_slot else 0)
+            await apply_transition(old_slot[0], old_slot[1], mask_to_periods(released_mask), BookingState.PENDING, None)
+        elif old_status not in active and new_status == BookingState.IN_USE:
+            await apply_transition(new_slot[0], new_slot[1], mask_to_periods(new_mask), BookingState.PENDING, BookingState.IN_USE)
+        elif old_status in active and old_status != new_status:
+            await apply_transition(old_slot[0], old_slot[1], mask_to_periods(old_mask), old_status, new_status)
+
+        booking = Booking.parse_obj(updated)
+        response.headers["ETag"] = revision_etag(booking.revision or 0)
         return booking
     except HTTPException:
         raise
@@ -180,15 +552,25 @@ async def update_booking_room(
 
 @router.get(
     "/{room_id}",
-    response_model=List[Booking]
+    response_model=List[BookingSummary]
 )
 async def get_list_booking_of_room(
-    room_id: str
+    room_id: str,
+    response: Response,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
 ):
     try:
-        # Get all bookings for specific room
-        bookings = await Booking.find({"room_id": room_id}).to_list()
+        # Get one page of bookings for specific room
+        query = build_page_query({"room_id": room_id}, BOOKING_SORT_FIELDS, cursor, from_date, to_date)
+        bookings = await Booking.find(query).sort(BOOKING_SORT).limit(limit).project(BookingSummary).to_list()
+        bookings = await with_archived(bookings, query, BOOKING_SORT, limit, from_date, to_date)
+        set_next_cursor(response, bookings, BOOKING_SORT_FIELDS, limit)
         return bookings
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -199,21 +581,33 @@ async def get_list_booking_of_room(
 )
 async def cancel_booking(
     booking_id: str,
+    email: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None),
+):
+    return await run_idempotent(
+        idempotency_key,
+        f"cancel_booking:{booking_id}",
+        request_fingerprint(booking_id, email),
+        lambda: do_cancel_booking(booking_id, email),
+    )
+
+
+async def do_cancel_booking(
+    booking_id: str,
+    email: Optional[str] = None,
 ):
     try:
-        # Get booking by ID
-        booking = await Booking.find_one(Booking.booking_id == booking_id)
-        if not booking:
-            raise HTTPException(status_code=404, detail="Booking not found")
+        # Update booking status to cancelled if it is not already cancelled
+        result = await transition_booking_status(
+            booking_id, {"$ne": BookingState.CANCELLED}, BookingState.CANCELLED, email
+        )
+        if result:
+            return result[0]
 
-        # Check if booking can be cancelled (not already cancelled)
+        booking = await get_user_booking(booking_id, email)
         if booking.status == BookingState.CANCELLED:
             raise HTTPException(status_code=400, detail="Booking is already cancelled")
-
-        # Update booking status to cancelled
-        booking.status = BookingState.CANCELLED
-        await booking.save()
-        return booking
+        raise HTTPException(status_code=409, detail="Booking was modified concurrently, please retry")
     except HTTPException:
         raise
     except Exception as e:
@@ -238,34 +632,57 @@ async def get_booking_detail(
 
 @router.get(
     "/user/{student_id}",
-    response_model=List[Booking]
+    response_model=List[BookingSummary]
 )
 async def get_user_bookings(
     student_id: str,
+    response: Response,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
 ):
     try:
-        bookings = await Booking.find({"student_id": student_id}).to_list()
+        query = build_page_query({"student_id": student_id}, BOOKING_SORT_FIELDS, cursor, from_date, to_date)
+        bookings = await Booking.find(query).sort(BOOKING_SORT).limit(limit).project(BookingSummary).to_list()
+        bookings = await with_archived(bookings, query, BOOKING_SORT, limit, from_date, to_date)
+        set_next_cursor(response, bookings, BOOKING_SORT_FIELDS, limit)
         return bookings
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/calendar/user")
-async def get_user_calendar(email: str):
+async def get_user_calendar(
+    email: str,
+    response: Response,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
     try:
         # Get all active bookings (both pending and in-use) for the user
         query = {
             "email": email,
             "status": {"$in": [BookingState.PENDING, BookingState.IN_USE, BookingState.COMPLETED, BookingState.CANCELLED]}
         }
-        
-        bookings = await Booking.find(query).to_list()
-        
+        query = build_page_query(query, BOOKING_SORT_FIELDS, cursor, from_date, to_date)
+
+        # Sort by date in descending order (newest first)
+        bookings = await Booking.find(query).sort(BOOKING_SORT).limit(limit).project(BookingSummary).to_list()
+        bookings = await with_archived(bookings, query, BOOKING_SORT, limit, from_date, to_date)
+        set_next_cursor(response, bookings, BOOKING_SORT_FIELDS, limit)
+
+        # Get room details for all booked rooms in one batch
+        rooms_by_id = await room_cache.get_many(booking.room_id for booking in bookings)
+
         # Format data for calendar view
         calendar_data = []
         for booking in bookings:
-            # Get room details
-            room = await Room.find_one(Room.room_id == booking.room_id)
+            room = rooms_by_id.get(booking.room_id)
             room_name = f"Room {booking.room_id}" if not room else f"Room {room.room_id} (Capacity: {room.capacity})"
             
             calendar_event = {
@@ -279,65 +696,64 @@ async def get_user_calendar(email: str):
                 "student_name": booking.student_name,
                 "status": booking.status,
                 "email": booking.email,
-                "qr_code": booking.qr_code if hasattr(booking, 'qr_code') else None
+                "qr_url": f"/api/booking/{booking.booking_id}/qr"
             }
             calendar_data.append(calendar_event)
-        
-        # Sort by date in descending order (newest first)
-        calendar_data.sort(key=lambda x: x["date"], reverse=True)
+
         return calendar_data
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post(
-    "/checkin/{booking_id}",
+    "/checkin/qr",
     response_model=Booking
 )
-async def checkin_booking(
-    booking_id: str,
-    email: str,
+async def checkin_booking_by_qr(
+    qr_data: str,
 ):
     try:
-        # Get booking by ID
-        booking = await Booking.find_one(Booking.booking_id == booking_id)
-        if not booking:
-            raise HTTPException(status_code=404, detail="Booking not found")
-
-        # Verify user
-        if booking.email != email:
-            raise HTTPException(status_code=403, detail="This booking belongs to another user")
-
-        # Get room
-        room = await Room.find_one(Room.room_id == booking.room_id)
-        if not room:
-            raise HTTPException(status_code=404, detail="Room not found")
+        # QR data format: "booking_id|email"
+        try:
+            booking_id, email = qr_data.split("|")
+        except:
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid QR code format"
+            )
 
-        # Check if booking is pending
-        if booking.status != BookingState.PENDING:
-            raise HTTPException(status_code=400, detail="Booking is not in pending state")
+        return await checkin_pending_booking(booking_id, email)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Check if current time is within booking periods
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        current_period = get_current_period()
 
-        if current_date != booking.date:
-            raise HTTPException(status_code=400, detail="Can only check in on the booking date")
-            
-        if current_period == 0:
-            raise HTTPException(status_code=400, detail="Check-in is only available during valid periods (6AM-6PM)")
-            
-        # if current_period not in booking.selected_periods:
-        #     raise HTTPException(
-        #         status_code=400, 
-        #         detail="Can only check in during your booked periods"
-        #     )
+@router.post(
+    "/checkin/{booking_id}",
+    response_model=Booking
+)
+async def checkin_booking(
+    booking_id: str,
+    email: str,
+    idempotency_key: Optional[str] = Header(None),
+):
+    return await run_idempotent(
+        idempotency_key,
+        f"checkin_booking:{booking_id}",
+        request_fingerprint(booking_id, email),
+        lambda: do_checkin_booking(booking_id, email),
+    )
 
-        # Update booking status
-        booking.status = BookingState.IN_USE
-        await booking.save()
 
-        return booking
+async def do_checkin_booking(
+    booking_id: str,
+    email: str,
+):
+    try:
+        return await checkin_pending_booking(booking_id, email)
     except HTTPException:
         raise
     except Exception as e:
@@ -351,44 +767,89 @@ async def checkin_booking(
 async def checkout_booking(
     booking_id: str,
     email: str,
+    idempotency_key: Optional[str] = Header(None),
 ):
-    try:
-        # Get booking by ID
-        booking = await Booking.find_one(Booking.booking_id == booking_id)
-        if not booking:
-            raise HTTPException(status_code=404, detail="Booking not found")
+    return await run_idempotent(
+        idempotency_key,
+        f"checkout_booking:{booking_id}",
+        request_fingerprint(booking_id, email),
+        lambda: do_checkout_booking(booking_id, email),
+    )
 
-        # Verify user
-        if booking.email != email:
-            raise HTTPException(status_code=403, detail="This booking belongs to another user")
 
-        # Get room
-        room = await Room.find_one(Room.room_id == booking.room_id)
-        if not room:
-            raise HTTPException(status_code=404, detail="Room not found")
-
-        # # Check if room is in use
-        # if room.room_state != RoomState.IN_USE:
-        #     raise HTTPException(status_code=400, detail="Room is not in use")
+async def do_checkout_booking(
+    booking_id: str,
+    email: str,
+):
+    try:
+        # Update booking status if it is in use
+        result = await transition_booking_status(
+            booking_id, BookingState.IN_USE, BookingState.COMPLETED, email
+        )
+        if result:
+            return result[0]
 
-        # Check if booking is in use
+        booking = await get_user_booking(booking_id, email)
         if booking.status != BookingState.IN_USE:
             raise HTTPException(status_code=400, detail="Booking is not in use")
+        raise HTTPException(status_code=409, detail="Booking was modified concurrently, please retry")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # # Verify booking
-        # if room.current_reserved_by_booking_id != booking_id:
-        #     raise HTTPException(status_code=400, detail="Booking ID does not match current reservation")
 
-        # Update room state to AVAILABLE
-        # room.room_state = RoomState.AVAILABLE
-        # room.current_reserved_by_booking_id = None
-        # await room.save()
+@router.get("/{booking_id}/qr")
+async def get_booking_qr(
+    booking_id: str,
+    if_none_match: Optional[str] = Header(None),
+):
+    try:
+        # Only the fields in the QR data, never the legacy qr_code blob
+        doc = await Booking.get_motor_collection().find_one(
+            {"booking_id": booking_id}, projection={"_id": 0, "booking_id": 1, "email": 1}
+        )
+        if not doc:
+            raise HTTPException(status_code=404, detail="Booking not found")
 
-        # Update booking status
-        booking.status = BookingState.COMPLETED
-        await booking.save()
+        # The image only depends on the QR data, so its hash is a stable ETag
+        qr_data = get_qr_data(doc["booking_id"], doc.get("email"))
+        etag = f'"{hashlib.sha1(qr_data.encode("utf-8")).hexdigest()}"'
+        headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+        if if_none_match == etag:
+            return Response(status_code=304, headers=headers)
 
-        return booking
+        png = await run_in_threadpool(render_qr_png, qr_data)
+        return Response(content=png, media_type="image/png", headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/admin/export")
+async def export_bookings(
+    export_format: str = Query("ndjson", alias="format", regex="^(ndjson|csv)$"),
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    room_id: Optional[str] = None,
+    status: Optional[str] = None,
+    user: dict = Depends(admin_required)
+):
+    try:
+        query = {}
+        if room_id:
+            query["room_id"] = room_id
+        if status:
+            query["status"] = status
+        query = build_page_query(query, BOOKING_SORT_FIELDS, None, from_date, to_date)
+
+        media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+        return StreamingResponse(
+            stream_bookings_export(query, export_format, from_date, to_date),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="bookings.{export_format}"'},
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -411,59 +872,3 @@ async def get_user_profile(email: str):
         raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-
-
-@router.post(
-    "/checkin/qr",
-    response_model=Booking
-)
-async def checkin_booking_by_qr(
-    qr_data: str,
-):
-    try:
-        # QR data format: "booking_id|email"
-        try:
-            booking_id, email = qr_data.split("|")
-        except:
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid QR code format"
-            )
-
-        # Get booking by ID
-        booking = await Booking.find_one(Booking.booking_id == booking_id)
-        if not booking:
-            raise HTTPException(status_code=404, detail="Booking not found")
-
-        # Verify user
-        if booking.email != email:
-            raise HTTPException(status_code=403, detail="This booking belongs to another user")
-
-        # Get room
-        room = await Room.find_one(Room.room_id == booking.room_id)
-        if not room:
-            raise HTTPException(status_code=404, detail="Room not found")
-
-        # Check if booking is pending
-        if booking.status != BookingState.PENDING:
-            raise HTTPException(status_code=400, detail="Booking is not in pending state")
-
-        # Check if current time is within booking periods
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        current_period = get_current_period()
-
-        if current_date != booking.date:
-            raise HTTPException(status_code=400, detail="Can only check in on the booking date")
-            
-        if current_period == 0:
-            raise HTTPException(status_code=400, detail="Check-in is only available during valid periods (6AM-6PM)")
-
-        # Update booking status
-        booking.status = BookingState.IN_USE
-        await booking.save()
-
-        return booking
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
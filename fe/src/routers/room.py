@@ -1,15 +1,34 @@
-from fastapi import APIRouter, Header, HTTPException, Depends
+from fastapi import APIRouter, Header, HTTPException, Depends, Response, Request, Query
+from fastapi.responses import StreamingResponse
 from models.room import CreateRoomRequest, UpdateRoomRequest, Room
-from models.booking import Booking
+from models.booking import Booking, booking_date_filter
+from models.occupancy import RoomOccupancy, PERIODS_PER_DAY, periods_to_mask
 from const import RoomState, BookingState
-from typing import List
-from datetime import datetime
+from typing import List, Optional
+from datetime import datetime, timedelta
 from fastapi import Depends
 from utils import decode_access_token
-from api_v1.deps import admin_required
+from admin_cache import admin_required
+from room_cache import room_cache
+from concurrency import get_revision, revision_filter, revision_etag, check_if_match, raise_modified
+from pymongo import ReturnDocument
+from schedule_cache import schedule_cache, json_default
+from schedule_events import schedule_events
+from room_analytics import rollup_days, utilization, date_range
+import asyncio
+import json
 
 router = APIRouter(prefix="/room")
 
+# Seconds between SSE keep-alive comments when there are no events
+SSE_KEEPALIVE_SECONDS = 15
+
+# Furthest number of days /room/search looks ahead for a free date
+MAX_SEARCH_DAYS = 90
+
+# Longest range accepted by the analytics endpoints
+MAX_ANALYTICS_DAYS = 366
+
 
 @router.post(
     "/",
@@ -33,6 +52,8 @@ async def create_room(
             current_reserved_by_booking_id=None
         )
         await room.save()
+        room_cache.invalidate(room.room_id)
+        await schedule_cache.invalidate_all()
         return room
     except HTTPException:
         raise
@@ -47,47 +68,65 @@ async def create_room(
 async def list_room():
     try:
         # Get all rooms
-        rooms = await Room.find_all().to_list()
+        rooms = await room_cache.list_all()
         return rooms
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+async def build_room_schedules(date: str) -> List[dict]:
+    """
+    Status of each of the 12 periods of every room on the given date
+    """
+    rooms = await room_cache.list_all()
+
+    # Occupancy masks for every room on the specified date in one query
+    occupancies = await RoomOccupancy.find({"date": date}).to_list()
+    occupancy_by_room = {occupancy.room_id: occupancy for occupancy in occupancies}
+
+    room_schedules = []
+    for room in rooms:
+        # Initialize room schedule with all periods as available
+        room_schedule = {
+            "room_id": room.room_id,
+            "status": [RoomState.AVAILABLE] * PERIODS_PER_DAY,
+        }
+
+        # IN_USE bookings take precedence over PENDING ones
+        # COMPLETED and CANCELLED bookings are not in any mask and show as AVAILABLE
+        occupancy = occupancy_by_room.get(room.room_id)
+        if occupancy and occupancy.occupied_mask:
+            for period in range(PERIODS_PER_DAY):
+                bit = 1 << period
+                if occupancy.in_use_mask & bit:
+                    room_schedule["status"][period] = RoomState.IN_USE
+                elif occupancy.booked_mask & bit:
+                    room_schedule["status"][period] = RoomState.BOOKED
+
+        room_schedules.append(room_schedule)
+
+    return room_schedules
+
+
 @router.get(
     "/schedules"
 )
 async def get_room_schedules(
     date: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
 ):
     try:
-        rooms = await Room.find_all().to_list()
-        room_schedules = []
-        
-        for room in rooms:
-            # Initialize room schedule with all periods as available
-            room_schedule = {
-                "room_id": room.room_id,
-                "status": [RoomState.AVAILABLE] * 12,  # 12 periods in a day
-            }
-            
-            # Get all active bookings for this room on the specified date
-            bookings = await Booking.find({
-                "room_id": room.room_id,
-                "date": date,
-                "status": {"$in": [BookingState.PENDING, BookingState.IN_USE]}
-            }).to_list()
-            
-            # Update status for each booking's selected periods
-            for booking in bookings:
-                for period in booking.selected_periods:
-                    if booking.status == BookingState.IN_USE:
-                        room_schedule["status"][period - 1] = RoomState.IN_USE
-                    elif booking.status == BookingState.PENDING:
-                        room_schedule["status"][period - 1] = RoomState.BOOKED
-                    # COMPLETED and CANCELLED bookings will show as AVAILABLE (default state)
-            
-            room_schedules.append(room_schedule)
-            
+        cached = await schedule_cache.get(date)
+        if cached:
+            etag, room_schedules = cached
+        else:
+            room_schedules = await build_room_schedules(date)
+            etag = await schedule_cache.set(date, room_schedules)
+
+        if if_none_match == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
         return room_schedules
     except HTTPException:
         raise
@@ -95,6 +134,152 @@ async def get_room_schedules(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.get(
+    "/schedules/events"
+)
+async def stream_schedule_events(
+    request: Request,
+    date: Optional[str] = None,
+):
+    """
+    Server-Sent Events stream of period status changes
+    Clients load /room/schedules once, then apply the deltas pushed here
+    """
+    queue = schedule_events.subscribe(date)
+
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(event, default=json_default)}\n\n"
+        finally:
+            schedule_events.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get(
+    "/search"
+)
+async def search_free_rooms(
+    date: str,
+    start_period: int = Query(..., ge=1, le=PERIODS_PER_DAY),
+    end_period: int = Query(..., ge=1, le=PERIODS_PER_DAY),
+    min_capacity: int = Query(0, ge=0),
+    days_ahead: int = Query(14, ge=1, le=MAX_SEARCH_DAYS),
+    limit: int = Query(20, ge=1, le=200),
+):
+    """
+    Rooms with enough capacity that are free for start_period..end_period on
+    date, or on the first later date (within days_ahead) where they are
+    Ranked by date, then by the smallest sufficient capacity
+    """
+    try:
+        if end_period < start_period:
+            raise HTTPException(status_code=400, detail="end_period must not be before start_period")
+        try:
+            start_date = datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date, expected YYYY-MM-DD")
+
+        mask = periods_to_mask(range(start_period, end_period + 1))
+        dates = [(start_date + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days_ahead)]
+
+        rooms = [
+            room for room in await room_cache.list_all()
+            if room.room_state == RoomState.AVAILABLE and (room.capacity or 0) >= min_capacity
+        ]
+
+        # One query for every (room, date) where any requested period is taken
+        busy_occupancies = await RoomOccupancy.find({
+            "date": {"$in": dates},
+            "$or": [
+                {"booked_mask": {"$bitsAnySet": mask}},
+                {"in_use_mask": {"$bitsAnySet": mask}},
+            ]
+        }).to_list()
+        busy = {(occupancy.room_id, occupancy.date) for occupancy in busy_occupancies}
+
+        results = []
+        for room in rooms:
+            free_date = next((d for d in dates if (room.room_id, d) not in busy), None)
+            if free_date:
+                results.append({
+                    "room_id": room.room_id,
+                    "capacity": room.capacity,
+                    "date": free_date,
+                    "periods": list(range(start_period, end_period + 1)),
+                })
+
+        # Dates are YYYY-MM-DD so they sort chronologically as strings
+        results.sort(key=lambda r: (r["date"], r["capacity"] or 0, r["room_id"]))
+        return results[:limit]
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def analytics_dates(from_date: str, to_date: str) -> List[str]:
+    try:
+        dates = date_range(from_date, to_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date, expected YYYY-MM-DD")
+    if not dates:
+        raise HTTPException(status_code=400, detail="to must not be before from")
+    if len(dates) > MAX_ANALYTICS_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range cannot exceed {MAX_ANALYTICS_DAYS} days")
+    return dates
+
+
+@router.get(
+    "/analytics/utilization"
+)
+async def get_room_utilization(
+    from_date: str = Query(..., alias="from"),
+    to_date: str = Query(..., alias="to"),
+    room_id: Optional[List[str]] = Query(None),
+    user: dict = Depends(admin_required)
+):
+    try:
+        analytics_dates(from_date, to_date)
+        room_ids = room_id or [room.room_id for room in await room_cache.list_all()]
+        return await utilization(from_date, to_date, room_ids)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post(
+    "/analytics/rollup"
+)
+async def rebuild_room_utilization(
+    from_date: str = Query(..., alias="from"),
+    to_date: str = Query(..., alias="to"),
+    user: dict = Depends(admin_required)
+):
+    """
+    Recompute daily rollups from bookings, archived ones included, e.g. to backfill history
+    """
+    try:
+        dates = analytics_dates(from_date, to_date)
+        rollups = await rollup_days(dates)
+        return {"dates": len(dates), "rollups": rollups}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.put(
     "/{room_id}",
     response_model=Room
@@ -102,24 +287,39 @@ async def get_room_schedules(
 async def update_room(
     room_id: str,
     update_room_request: UpdateRoomRequest,
+    response: Response,
+    if_match: Optional[str] = Header(None),
 ):
     try:
         # Get room by ID
-        room = await Room.find_one(Room.room_id == room_id)
-        if not room:
+        current = await Room.get_motor_collection().find_one({"room_id": room_id})
+        if not current:
             raise HTTPException(status_code=404, detail="Room not found")
 
+        revision = get_revision(current)
+        check_if_match(if_match, revision)
+
         # Don't allow updating room_id
-        if "room_id" in update_room_request.dict(exclude_unset=True):
+        update_data = update_room_request.dict(exclude_unset=True)
+        if "room_id" in update_data:
             raise HTTPException(status_code=400, detail="Cannot update room_id")
+        if not update_data:
+            response.headers["ETag"] = revision_etag(revision)
+            return Room.parse_obj(current)
 
-        # Update room with new data
-        update_data = update_room_request.dict(exclude_unset=True)
-        for key, value in update_data.items():
-            setattr(room, key, value)
+        # Only the changed fields are written, guarded on the revision that was read
+        updated = await Room.get_motor_collection().find_one_and_update(
+            {"room_id": room_id, "revision": revision_filter(revision)},
+            {"$set": update_data, "$inc": {"revision": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if updated is None:
+            raise_modified(if_match)
 
-        await room.save()
-        return room
+        room_cache.invalidate(room_id)
+        await schedule_cache.invalidate_all()
+        response.headers["ETag"] = revision_etag(get_revision(updated))
+        return Room.parse_obj(updated)
     except HTTPException:
         raise
     except Exception as e:
@@ -146,17 +346,19 @@ async def delete_room(
 
         # Check if room has any future bookings
         current_date = datetime.now().strftime("%Y-%m-%d")
-        future_bookings = await Booking.find({
+        future_booking = await Booking.get_motor_collection().find_one({
             "room_id": room_id,
-            "date": {"$gte": current_date},
-            "status": BookingState.PENDING
-        }).to_list()
+            "status": BookingState.PENDING,
+            **booking_date_filter(gte=current_date),
+        }, projection={"_id": 1})
 
-        if future_bookings:
+        if future_booking:
             raise HTTPException(status_code=400, detail="Cannot delete room with future bookings")
 
         # Delete room
         await room.delete()
+        room_cache.invalidate(room_id)
+        await schedule_cache.invalidate_all()
         return {"message": "Room deleted successfully"}
     except HTTPException:
         raise
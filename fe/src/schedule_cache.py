@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # Redis backend is optional
+    redis = None
+
+# Cached grids expire after this many seconds even without invalidation
+SCHEDULE_CACHE_TTL = int(os.getenv("SCHEDULE_CACHE_TTL", "30"))
+# Number of dates kept by the in-memory backend
+SCHEDULE_CACHE_MAX_DATES = int(os.getenv("SCHEDULE_CACHE_MAX_DATES", "64"))
+# Set to share the cache between workers, e.g. redis://localhost:6379/0
+SCHEDULE_CACHE_REDIS_URL = os.getenv("SCHEDULE_CACHE_REDIS_URL")
+
+
+def json_default(value: Any):
+    # Enum members (RoomState) serialise as their value
+    return getattr(value, "value", str(value))
+
+
+def make_etag(value: Any) -> str:
+    payload = json.dumps(value, sort_keys=True, default=json_default).encode("utf-8")
+    return f'"{hashlib.sha1(payload).hexdigest()}"'
+
+
+class MemoryBackend:
+    """
+    Bounded LRU over dates with a per-entry TTL
+    """
+
+    def __init__(self, max_dates: int = SCHEDULE_CACHE_MAX_DATES, ttl: int = SCHEDULE_CACHE_TTL):
+        self.max_dates = max_dates
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+
+    async def get(self, date: str) -> Optional[Tuple[str, Any]]:
+        entry = self._entries.get(date)
+        if entry is None:
+            return None
+        expires_at, etag, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[date]
+            return None
+        self._entries.move_to_end(date)
+        return etag, value
+
+    async def set(self, date: str, etag: str, value: Any):
+        self._entries[date] = (time.monotonic() + self.ttl, etag, value)
+        self._entries.move_to_end(date)
+        while len(self._entries) > self.max_dates:
+            self._entries.popitem(last=False)
+
+    async def delete(self, date: str):
+        self._entries.pop(date, None)
+
+    async def clear(self):
+        self._entries.clear()
+
+
+class RedisBackend:
+    """
+    Shared backend for multi-worker deployments, expiry handled by Redis TTL
+    """
+    prefix = "schedule:"
+
+    def __init__(self, url: str, ttl: int = SCHEDULE_CACHE_TTL):
+        if redis is None:
+            raise RuntimeError("redis package is required for the Redis schedule cache backend")
+        self.ttl = ttl
+        self._client = redis.from_url(url)
+
+    async def get(self, date: str) -> Optional[Tuple[str, Any]]:
+        raw = await self._client.get(self.prefix + date)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        return entry["etag"], entry["value"]
+
+    async def set(self, date: str, etag: str, value: Any):
+        entry = json.dumps({"etag": etag, "value": value}, default=json_default)
+        await self._client.set(self.prefix + date, entry, ex=self.ttl)
+
+    async def delete(self, date: str):
+        await self._client.delete(self.prefix + date)
+
+    async def clear(self):
+        keys = [key async for key in self._client.scan_iter(match=self.prefix + "*")]
+        if keys:
+            await self._client.delete(*keys)
+
+
+class ScheduleCache:
+    """
+    Per-date cache of the /room/schedules grid
+    Booking state changes invalidate their date, room changes invalidate everything
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+
+    async def get(self, date: str) -> Optional[Tuple[str, Any]]:
+        return await self.backend.get(date)
+
+    async def set(self, date: str, value: Any) -> str:
+        etag = make_etag(value)
+        await self.backend.set(date, etag, value)
+        return etag
+
+    async def invalidate(self, date: str):
+        await self.backend.delete(date)
+
+    async def invalidate_all(self):
+        await self.backend.clear()
+
+
+schedule_cache = ScheduleCache(
+    RedisBackend(SCHEDULE_CACHE_REDIS_URL) if SCHEDULE_CACHE_REDIS_URL else MemoryBackend()
+)
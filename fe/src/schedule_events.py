@@ -0,0 +1,48 @@
+import asyncio
+from typing import Dict, List, Optional
+
+# Pending events per subscriber before it is asked to resync
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+class ScheduleEventBroker:
+    """
+    In-process fan-out of period status changes to /room/schedules/events subscribers
+    Each subscriber gets a bounded queue; a subscriber that falls behind has its
+    queue replaced by a single resync event so it reloads the full grid instead
+    of blocking publishers.
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        # queue -> date filter (None means every date)
+        self._subscribers: Dict[asyncio.Queue, Optional[str]] = {}
+
+    def subscribe(self, date: Optional[str] = None) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[queue] = date
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.pop(queue, None)
+
+    def publish(self, room_id: str, date: str, periods: List[int], state: str):
+        if not periods:
+            return
+        event = {"type": "delta", "room_id": room_id, "date": date, "periods": periods, "state": state}
+        for queue, date_filter in list(self._subscribers.items()):
+            if date_filter is not None and date_filter != date:
+                continue
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync", "date": date})
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+
+schedule_events = ScheduleEventBroker()